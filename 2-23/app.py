@@ -5,11 +5,17 @@ Last update: February 25, 2020
 '''
 
 # Import the required tools from flask
-from flask import Flask, render_template, request
+from flask import Flask, render_template, request, abort
 
 # Import the Volume class
 from functions import Volume
 
+# Import the cache of rendered pages
+from responses import ResponseCache
+
+import hashlib
+import os
+
 app = Flask(__name__)
 
 # Instantiate the Document object for Title 13, Volume 1
@@ -17,23 +23,78 @@ app = Flask(__name__)
 # The choice of a single volume simplifies the demostration. 
 CFR = Volume('CFR_Title13_Volume1.xml')
 
+# How long browsers and proxies may reuse a summary page
+PAGE_MAX_AGE = 3600
+
+def template_version():
+    
+    # A hash of the templates, so editing one of them
+    # never serves a page rendered from the old version
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(app.template_folder)):
+        with open(os.path.join(app.template_folder, name), 'rb') as template:
+            digest.update(template.read())
+    return digest.hexdigest()[:16]
+
+TEMPLATE_VERSION = template_version()
+
+# Rendered summary pages, keyed by (section number, template version)
+summary_pages = ResponseCache()
+
 @app.route("/", methods=["GET"])
 def index():
     return render_template("index.html")
 
-@app.route("/summary", methods=["POST"])
+def page_response(page):
+    
+    '''
+    Send a CachedPage, compressed if the client accepts gzip.
+    GET responses may be cached by browsers and proxies.
+    '''
+    
+    compress = 'gzip' in request.headers.get('Accept-Encoding', '')
+    response = app.response_class(mimetype='text/html')
+    response.headers['Vary'] = 'Accept-Encoding'
+    
+    if request.method == 'GET':
+        response.set_etag(page.etag + ('-gz' if compress else ''))
+        response.headers['Cache-Control'] = 'public, max-age=%d' % PAGE_MAX_AGE
+        if response.get_etag()[0] in request.if_none_match:
+            response.status_code = 304
+            return response
+    
+    if compress:
+        response.set_data(page.gzipped)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response.set_data(page.html)
+    return response
+
+@app.route("/summary", methods=["GET", "POST"])
 def summary():
     
     # Retrieve the section number input by the user
-    # from the home page.
-    number = int(request.form["sectno"])
+    # from the home page (a form field for POST,
+    # the query string for GET).
+    # Anything but a whole number is a bad request, not a crash
+    number = request.values.get("sectno", type=int)
+    if number is None:
+        abort(400)
     print(number)
+    
+    # The page may already be rendered
+    key = (number, TEMPLATE_VERSION)
+    page = summary_pages.get(key)
+    if page is not None:
+        return page_response(page)
 
     # The search_by_number method returns a tuple.
     result = CFR.search_by_number(number)
 
     # The first element in the tuple "result" is True,
     # confirming that a section was found.
+    if not result[0]:
+        abort(404)
     
     # The second element is the Section object
     # whose number matches the user's input.
@@ -47,6 +108,9 @@ def summary():
     text = section.text
     summary = section.summary
     
-    return render_template("summary.html", number=str(number), text=text, summary=summary)
+    html = render_template("summary.html", number=str(number), text=text, summary=summary)
+    page = summary_pages.put(key, html)
+    
+    return page_response(page)
 
 app.run(debug=False)
@@ -62,8 +62,10 @@ Bag of Words:
 # Import regular expressions
 import re
 
-# Import the sentence tokenizer from the natural language toolkit
-from nltk.tokenize import sent_tokenize
+# Import the sentence splitter for legal text, which is set up
+# once per process (unlike NLTK's sent_tokenize, which goes
+# through its loader on every call)
+from sentences import split_sentences
 
 # Import the summarize and keywords functions from gensim
 from gensim.summarization import summarize, keywords
@@ -131,7 +133,7 @@ def get_summary(text):
     prepro = preprocess(text)
         
     # count the sentences
-    sentences = sent_tokenize(prepro)
+    sentences = split_sentences(prepro)
     sent_count = len(sentences)
         
     # compute the summary to text ratio
@@ -0,0 +1,91 @@
+'''
+Defines the ResponseCache class.
+
+A ResponseCache object keeps rendered pages in memory,
+both as plain HTML and pre-compressed with gzip, so a page
+that has been rendered once is never rendered again.
+
+It is an LRU cache with a budget in bytes: when a new page
+does not fit, the least recently used pages are dropped.
+It counts hits and misses, so the hit rate can be checked.
+'''
+
+###############################
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+###############################
+
+class CachedPage():
+
+    '''
+    A rendered page: the HTML, its gzip form and an ETag.
+    '''
+
+    def __init__(self, html):
+        self.html = html.encode('utf-8')
+        self.gzipped = gzip.compress(self.html)
+        self.etag = hashlib.sha256(self.html).hexdigest()[:32]
+        self.size = len(self.html) + len(self.gzipped)
+
+#####################################################################
+
+class ResponseCache():
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+
+        self.max_bytes = max_bytes
+        self.pages = OrderedDict() # key -> CachedPage, oldest first
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+
+        # Returns the CachedPage, or None on a miss
+        with self.lock:
+            page = self.pages.get(key)
+            if page is None:
+                self.misses += 1
+                return None
+            self.pages.move_to_end(key)
+            self.hits += 1
+            return page
+
+    def put(self, key, html):
+
+        # Store a rendered page and return its CachedPage
+        page = CachedPage(html)
+        with self.lock:
+            old = self.pages.pop(key, None)
+            if old is not None:
+                self.size -= old.size
+
+            # Pages bigger than the whole budget are not kept
+            if page.size > self.max_bytes:
+                return page
+
+            self.pages[key] = page
+            self.size += page.size
+            while self.size > self.max_bytes:
+                oldest_key, oldest = self.pages.popitem(last=False)
+                self.size -= oldest.size
+        return page
+
+    def clear(self):
+
+        # Drop every page (the counters are kept)
+        with self.lock:
+            self.pages.clear()
+            self.size = 0
+
+    def stats(self):
+
+        # The counters, as a dictionary
+        with self.lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'pages': len(self.pages),
+                    'bytes': self.size}
@@ -5,40 +5,218 @@ Last update: February 25, 2020
 '''
 
 # Import the required tools from flask
-from flask import Flask, render_template, request
+from flask import Flask, render_template, request, jsonify, abort, g
 
 # Import the Volume class
-from functions import Volume
+from functions import Volume, fingerprint, flights, SUMMARY_SENTENCES
+
+# Import the on-disk summary cache
+from cache import SummaryCache
+
+# Import the cache of rendered pages
+from responses import ResponseCache
+
+# Import the timers and the Prometheus exporter
+import metrics
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
 
 app = Flask(__name__)
 
-# Instantiate the Document object for Title 13, Volume 1
-# The same process could be applied to other volumes.
-# The choice of a single volume simplifies the demostration. 
-CFR = Volume('CFR_Title13_Volume1.xml')
+# Seconds a client should wait before retrying while the volume loads
+RETRY_AFTER = 5
+
+# How long clients and CDNs may reuse a JSON API response
+API_MAX_AGE = 3600
+
+# The most sections one batch request may ask for
+API_BATCH_LIMIT = 500
+
+# How long browsers and proxies may reuse a summary page
+PAGE_MAX_AGE = 3600
+
+def template_version():
+    
+    # A hash of the templates, so editing one of them
+    # never serves a page rendered from the old version
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(app.template_folder)):
+        with open(os.path.join(app.template_folder, name), 'rb') as template:
+            digest.update(template.read())
+    return digest.hexdigest()[:16]
 
-# Get a list of the section numbers from the Volume object.
+TEMPLATE_VERSION = template_version()
+
+# Rendered summary pages, keyed by (section number, length, template version)
+summary_pages = ResponseCache()
+metrics.watch_cache('response', summary_pages)
+
+# How many on-demand computations are running (the counters of
+# those started and joined are kept by the SingleFlight itself)
+metrics.gauge('regsum_single_flight_in_flight', 'Summaries and keywords being computed on demand right now',
+              'flight', lambda: {flights.name: flights.stats()['in_flight']})
+
+# The Volume is loaded on a background thread, so the app can answer
+# health checks right away. Until it is ready, CFR is None.
+CFR = None
 numbers = []
-for section in CFR.sections:
-    numbers.append(section.number)
+status = {'stage': 'starting', 'sections': 0, 'warmed': 0, 'error': None}
+
+def load_volume():
+    
+    global CFR, numbers
+    
+    try:
+        # Instantiate the Document object for Title 13, Volume 1
+        # The same process could be applied to other volumes.
+        # The choice of a single volume simplifies the demostration. 
+        # If a precompiled artifact exists (see "python regsum.py build"),
+        # open it: the app then starts without any NLP work at all.
+        # Otherwise summaries are kept in an on-disk cache, so a restart
+        # with an unchanged volume does not have to summarize it again.
+        status['stage'] = 'loading'
+        if os.path.exists('CFR_Title13_Volume1.regsum'):
+            volume = Volume.load('CFR_Title13_Volume1.regsum')
+        else:
+            cache = SummaryCache('regsum_cache.sqlite')
+            metrics.watch_cache('summary', cache)
+            volume = Volume('CFR_Title13_Volume1.xml', cache=cache)
+            
+            # The TF-IDF keywords and the related sections of every
+            # section, in one quick pass, before any request is served,
+            # so the pages and the JSON API never see them missing
+            volume.rank_keywords()
+            volume.relate_sections()
+        
+        # Get a list of the section numbers from the Volume object.
+        numbers = [section.number for section in volume.sections]
+        status['sections'] = len(numbers)
+        
+        # From here on requests are served. A missing summary
+        # is computed on demand when its section is opened.
+        CFR = volume
+        status['stage'] = 'warming'
+        
+        # Keep summarizing in the background, so that later
+        # requests find their summary already computed.
+        def progress(done, total):
+            status['warmed'] = done
+        volume.warm(progress=progress)
+        status['warmed'] = len(numbers)
+        status['stage'] = 'ready'
+    
+    except Exception as error:
+        status['stage'] = 'failed'
+        status['error'] = str(error)
+        raise
+
+threading.Thread(target=load_volume, name='load-volume', daemon=True).start()
+
+@app.before_request
+def start_timer():
+    if metrics.ENABLED:
+        g.start = time.perf_counter()
+
+@app.after_request
+def stop_timer(response):
+    
+    # Time every request, grouped by the route that answered it
+    if metrics.ENABLED and 'start' in g:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe('regsum_request_seconds', endpoint, time.perf_counter() - g.start)
+    return response
+
+def not_ready():
+    
+    # A fast answer while the volume is still loading
+    response = jsonify(status)
+    response.status_code = 503
+    response.headers['Retry-After'] = str(RETRY_AFTER)
+    return response
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    
+    # The process is up and answering, whatever the volume is doing.
+    # Only a failed load makes the node unhealthy.
+    response = jsonify(status)
+    if status['stage'] == 'failed':
+        response.status_code = 500
+    return response
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    
+    # Ready as soon as the sections can be served
+    if CFR is None:
+        return not_ready()
+    return jsonify(status)
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    
+    # Stage timings, request latency and cache hit rates,
+    # in the Prometheus text format
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route("/", methods=["GET"])
 def index():
+    if CFR is None:
+        return not_ready()
     return render_template("index.html", numbers=numbers)
 
-@app.route("/summary", methods=["POST"])
+def page_response(page):
+    
+    '''
+    Send a CachedPage, compressed if the client accepts gzip.
+    GET responses may be cached by browsers and proxies.
+    '''
+    
+    compress = 'gzip' in request.headers.get('Accept-Encoding', '')
+    response = app.response_class(mimetype='text/html')
+    response.headers['Vary'] = 'Accept-Encoding'
+    
+    if request.method == 'GET':
+        response.set_etag(page.etag + ('-gz' if compress else ''))
+        response.headers['Cache-Control'] = 'public, max-age=%d' % PAGE_MAX_AGE
+        if response.get_etag()[0] in request.if_none_match:
+            response.status_code = 304
+            return response
+    
+    if compress:
+        response.set_data(page.gzipped)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response.set_data(page.html)
+    return response
+
+@app.route("/summary", methods=["GET", "POST"])
 def summary():
     
+    if CFR is None:
+        return not_ready()
+    
     # Retrieve the section number input by the user
-    # from the home page.
-    number = int(request.form["sectno"])
+    # from the home page (a form field for POST,
+    # the query string for GET).
+    # Anything but a whole number is a bad request, not a crash
+    number = request.values.get("sectno", type=int)
+    if number is None:
+        abort(400)
     print(number)
-
+    
     # The search_by_number method returns a tuple.
     result = CFR.search_by_number(number)
 
     # The first element in the tuple "result" is True,
     # confirming that a section was found.
+    if not result[0]:
+        abort(404)
     
     # The second element is the Section object
     # whose number matches the user's input.
@@ -47,11 +225,155 @@ def summary():
     # the second element of "result" (index 1).
     section = result[1]
     
+    # The number of sentences in the summary ("length"),
+    # changed with the Shorter / Longer links on the page.
+    # It is at most the number of sentences in the section,
+    # so made-up lengths cannot fill the page cache. (The count
+    # is known without decoding the ranking of the section.)
+    sentences = section.sentence_count()
+    length = request.values.get("length", SUMMARY_SENTENCES, type=int)
+    length = max(1, min(length, sentences))
+    
+    # The page may already be rendered
+    key = (number, length, TEMPLATE_VERSION)
+    page = summary_pages.get(key)
+    if page is not None:
+        return page_response(page)
+    
     # The summary page will display both the summary
     # and the original text.
+    # (If the background warm-up has not reached this
+    # section yet, the summary is computed right now.
+    # Other lengths come from the cached sentence ranking.)
     text = section.text
-    summary = section.summary
+    summary = section.summary_of(length)
+    
+    # The most similar sections, found once for the whole volume
+    if section.related is None:
+        CFR.relate_sections()
+    
+    html = render_template("summary.html", number=str(number), text=text, summary=summary,
+                           length=length, sentences=sentences,
+                           related=section.related)
+    page = summary_pages.put(key, html)
+    
+    return page_response(page)
+
+@app.route("/search", methods=["GET"])
+def search():
+    
+    if CFR is None:
+        return not_ready()
+    
+    # Retrieve the free-text query input by the user
+    query = request.args.get("q", "")
+    
+    # The search method returns (score, Section) pairs,
+    # best match first.
+    results = CFR.search(query, k=10)
+    
+    return render_template("search.html", query=query, results=results)
+
+def section_json(section, length=SUMMARY_SENTENCES):
+    
+    # The JSON form of one section
+    return {'number': section.number,
+            'text': section.text,
+            'summary': section.summary_of(length),
+            'keyword': section.keyword,
+            'keywords': [{'keyword': word, 'score': score}
+                         for word, score in section.keywords or []],
+            'related': [{'number': number, 'similarity': similarity}
+                        for number, similarity in section.related or []]}
+
+def api_response(data):
+    
+    '''
+    Turn a JSON-able object into a cacheable response:
+        - a strong ETag derived from the content
+        - 304 Not Modified when the client already has it
+        - gzip compression when the client accepts it
+    '''
+    
+    body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    etag = fingerprint(body.decode('utf-8'))[:32]
+    
+    # The compressed body is a different representation,
+    # so it gets its own strong ETag.
+    compress = 'gzip' in request.headers.get('Accept-Encoding', '')
+    if compress:
+        etag = etag + '-gz'
+    
+    response = app.response_class(mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=%d' % API_MAX_AGE
+    response.headers['Vary'] = 'Accept-Encoding'
+    
+    # The client's copy is still good: nothing to send
+    if request.method == 'GET' and etag in request.if_none_match:
+        response.status_code = 304
+        return response
+    
+    if compress:
+        body = gzip.compress(body)
+        response.headers['Content-Encoding'] = 'gzip'
+    response.set_data(body)
+    return response
+
+@app.route("/api/sections/<int:number>", methods=["GET"])
+def api_section(number):
+    
+    if CFR is None:
+        return not_ready()
+    
+    found, section = CFR.search_by_number(number)
+    if not found:
+        return jsonify({'error': 'no section %d' % number}), 404
+    
+    length = max(1, request.args.get('length', SUMMARY_SENTENCES, type=int))
+    return api_response(section_json(section, length))
+
+def is_integer(value):
+    
+    # JSON true and false arrive as bool, which is a kind of int
+    return isinstance(value, int) and not isinstance(value, bool)
+
+@app.route("/api/sections:batch", methods=["POST"])
+def api_sections_batch():
+    
+    '''
+    Accepts {"numbers": [101, 120, ...], "length": 2} and returns
+    every section found, in the order asked for, plus the list
+    of numbers that do not exist. length (the number of summary
+    sentences) is optional.
+    '''
+    
+    if CFR is None:
+        return not_ready()
+    
+    # Valid JSON that is not an object ([1, 2], 5) is a bad request too
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'expected {"numbers": [int, ...]}'}), 400
+    numbers = data.get('numbers')
+    if not isinstance(numbers, list) or not all(is_integer(number) for number in numbers):
+        return jsonify({'error': 'expected {"numbers": [int, ...]}'}), 400
+    if len(numbers) > API_BATCH_LIMIT:
+        return jsonify({'error': 'at most %d sections per batch' % API_BATCH_LIMIT}), 400
+    length = data.get('length', SUMMARY_SENTENCES)
+    if not is_integer(length) or length < 1:
+        return jsonify({'error': 'length must be a positive integer'}), 400
+    
+    sections = []
+    missing = []
+    for number in numbers:
+        found, section = CFR.search_by_number(number)
+        if found:
+            sections.append(section_json(section, length))
+        else:
+            missing.append(number)
     
-    return render_template("summary.html", number=str(number), text=text, summary=summary)
+    return api_response({'sections': sections, 'missing': missing})
 
-app.run(debug=False)
+if __name__ == '__main__':
+    app.run(debug=False)
@@ -0,0 +1,155 @@
+'''
+Defines the SummaryCache class.
+
+A SummaryCache object stores the summary, keyword and
+sentence ranking of each section in an SQLite file on disk,
+so that restarting the application does not have to run
+TextRank over the whole volume again. The ranking is kept
+as the order of the sentence indexes (best first): the
+sentences themselves come from splitting the text again,
+which is cheap.
+
+Entries are content-addressed: the key is a hash of the
+preprocessed section text and the summarizer settings.
+An unchanged section therefore always finds its entry,
+and a changed section (or a change to the summarizer)
+simply misses and gets recomputed.
+
+The cache holds at most max_entries rows. When it grows
+past that, the least recently used rows are deleted first,
+which clears out the sections of old editions.
+'''
+
+###############################
+import hashlib
+from array import array
+import sqlite3
+import threading
+import time
+###############################
+
+class SummaryCache():
+
+    def __init__(self, filename, max_entries=20000):
+
+        # The maximum number of sections kept on disk
+        self.max_entries = max_entries
+
+        # Flask may serve requests from several threads,
+        # so every access to the connection goes through a lock.
+        self.lock = threading.Lock()
+
+        # Open (or create) the database file
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS summaries (
+                               key TEXT PRIMARY KEY,
+                               summary TEXT NOT NULL,
+                               keyword TEXT NOT NULL,
+                               last_used REAL NOT NULL,
+                               ranking BLOB)''')
+
+        # Files written before the ranking was stored lack its column
+        columns = [row[1] for row in self.db.execute('PRAGMA table_info(summaries)')]
+        if 'ranking' not in columns:
+            self.db.execute('ALTER TABLE summaries ADD COLUMN ranking BLOB')
+
+        self.db.execute('''CREATE INDEX IF NOT EXISTS summaries_last_used
+                           ON summaries (last_used)''')
+        self.db.commit()
+
+        # Lookups that found (and did not find) their key
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(text, settings):
+
+        '''
+        Hash the preprocessed text together with the summarizer
+        settings. Changing either one gives a different key.
+        '''
+
+        digest = hashlib.sha256()
+        digest.update(settings.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(text.encode('utf-8'))
+        return digest.hexdigest()
+
+    def get_many(self, keys):
+
+        '''
+        Look up several keys in one round trip.
+        Returns a dictionary of key -> (summary, keyword, order)
+        for the keys that were found, where order is the list of
+        sentence indexes, best first (or None if it was not stored).
+        '''
+
+        keys = list(keys)
+        found = {}
+        with self.lock:
+            # SQLite limits the number of parameters per query
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                marks = ','.join('?' * len(batch))
+                rows = self.db.execute('SELECT key, summary, keyword, ranking FROM summaries '
+                                       'WHERE key IN (%s)' % marks, batch)
+                for key, summary, keyword, ranking in rows:
+                    order = None
+                    if ranking is not None:
+                        order = array('i')
+                        order.frombytes(ranking)
+                        order = order.tolist()
+                    found[key] = (summary, keyword, order)
+            # Mark the hits as recently used so they survive eviction
+            now = time.time()
+            self.db.executemany('UPDATE summaries SET last_used = ? WHERE key = ?',
+                                [(now, key) for key in found])
+            self.db.commit()
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def get(self, key):
+
+        '''
+        Look up a single key.
+        Returns (summary, keyword, order), or None on a miss.
+        '''
+
+        return self.get_many([key]).get(key)
+
+    def put(self, key, summary, keyword, order=None):
+
+        # Store (or refresh) one entry, with the sentence order if known
+        ranking = array('i', order).tobytes() if order is not None else None
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO summaries '
+                            '(key, summary, keyword, last_used, ranking) VALUES (?, ?, ?, ?, ?)',
+                            (key, summary, keyword, time.time(), ranking))
+            self.db.commit()
+            self._evict()
+
+    def _evict(self):
+
+        # Delete the least recently used rows beyond the size cap
+        count = self.db.execute('SELECT COUNT(*) FROM summaries').fetchone()[0]
+        if count > self.max_entries:
+            self.db.execute('''DELETE FROM summaries WHERE key IN (
+                                   SELECT key FROM summaries
+                                   ORDER BY last_used LIMIT ?)''',
+                            (count - self.max_entries,))
+            self.db.commit()
+
+    def stats(self):
+
+        # The counters, as a dictionary
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM summaries').fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
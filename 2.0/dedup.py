@@ -0,0 +1,133 @@
+'''
+Defines the MinHashIndex class.
+
+A MinHashIndex finds sections whose text is nearly the same
+as a section it has already seen: the boilerplate that the
+CFR repeats from part to part and from title to title.
+
+    - Each text is cut into shingles: every run of SHINGLE
+      consecutive words.
+    - Its MinHash signature keeps, for each of PERMUTATIONS
+      random hash functions, the smallest hash of any shingle.
+      Two signatures agree in a position with a probability
+      equal to the Jaccard similarity of the shingle sets.
+    - Locality-sensitive hashing: the signature is cut into
+      BANDS bands, and texts that agree on a whole band land
+      in the same bucket. Only texts that share a bucket are
+      compared, so finding the duplicates of a text does not
+      look at every text seen so far.
+
+A candidate counts as a near-duplicate when its signatures
+agree in at least THRESHOLD of the positions.
+'''
+
+###############################
+import numpy as np
+###############################
+
+# Words per shingle
+SHINGLE = 5
+
+# Hash functions per signature, and how they are banded
+PERMUTATIONS = 64
+BANDS = 16
+ROWS = PERMUTATIONS // BANDS
+
+# The estimated Jaccard similarity of a near-duplicate
+THRESHOLD = 0.9
+
+# Shingles hashed at a time, which bounds the memory used by a long text
+BLOCK = 8192
+
+# Combines the word hashes of a shingle (any large odd number will do)
+MULTIPLIER = np.uint64(0x100000001b3)
+
+#####################################################################
+
+def shingles(text):
+
+    '''
+    The distinct 32-bit hashes of the SHINGLE-word runs of the text.
+    Words are split on whitespace (punctuation stays attached,
+    which is fine for comparing texts) and hashed with Python's
+    own string hash, and the hash of every run is combined from
+    them with numpy (wrapping around 2**64).
+    
+    Python salts string hashes per process, so signatures can
+    only be compared within one process. They are never stored.
+    '''
+
+    words = text.lower().split()
+    words = np.fromiter(map(hash, words), dtype=np.int64, count=len(words)).view(np.uint64)
+    count = max(len(words) - SHINGLE + 1, 1)
+    hashes = words[:count].copy()
+    for j in range(1, min(SHINGLE, len(words))):
+        hashes = hashes * MULTIPLIER + words[j:j + count]
+
+    # Fold into 32 bits, for the 32-bit MinHash functions
+    hashes = (hashes >> np.uint64(32)) ^ (hashes & np.uint64(0xffffffff))
+    return np.unique(hashes.astype(np.uint32))
+
+#####################################################################
+
+class MinHashIndex():
+
+    def __init__(self, seed=1):
+
+        # Each hash function is (a * x + b) mod 2**32 with a odd,
+        # which shuffles the 32-bit shingle hashes without collisions.
+        # 32-bit arithmetic is several times faster than 64-bit.
+        generator = np.random.RandomState(seed)
+        self.a = (generator.randint(0, 2 ** 31, size=PERMUTATIONS) * 2 + 1).astype(np.uint32)
+        self.b = generator.randint(0, 2 ** 32, size=PERMUTATIONS, dtype=np.uint64).astype(np.uint32)
+
+        self.signatures = {} # key -> signature
+        self.buckets = {} # (band, band of a signature) -> [keys]
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def signature(self, text):
+
+        # One minimum per hash function, over every shingle
+        values = shingles(text)
+        signature = np.full(PERMUTATIONS, np.iinfo(np.uint32).max, dtype=np.uint32)
+        for start in range(0, len(values), BLOCK):
+            hashes = np.multiply.outer(values[start:start + BLOCK], self.a) # wraps around 2**32
+            hashes += self.b
+            signature = np.minimum(signature, hashes.min(axis=0))
+        return signature
+
+    def bands(self, signature):
+        for band in range(BANDS):
+            yield (band, signature[band * ROWS:(band + 1) * ROWS].tobytes())
+
+    def query(self, text, signature=None):
+
+        '''
+        Returns (key, similarity) of the most similar text seen
+        so far, if it is a near-duplicate, and None otherwise.
+        '''
+
+        if signature is None:
+            signature = self.signature(text)
+
+        candidates = set()
+        for bucket in self.bands(signature):
+            candidates.update(self.buckets.get(bucket, ()))
+
+        best = None
+        for key in candidates:
+            similarity = float(np.mean(self.signatures[key] == signature))
+            if similarity >= THRESHOLD and (best is None or similarity > best[1]):
+                best = (key, similarity)
+        return best
+
+    def add(self, key, text, signature=None):
+
+        # Remember a text under a key
+        if signature is None:
+            signature = self.signature(text)
+        self.signatures[key] = signature
+        for bucket in self.bands(signature):
+            self.buckets.setdefault(bucket, []).append(key)
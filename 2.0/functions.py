@@ -62,15 +62,62 @@ Bag of Words:
 # Import regular expressions
 import re
 
-# Import the sentence tokenizer from the natural language toolkit
-from nltk.tokenize import sent_tokenize
+# Import the built-in TextRank summarizer, which works like gensim's
+# summarize and keywords but reads each text only once
+from textrank import analyze, rank, keywords_analysis, Ranking
 
-# Import the summarize and keywords functions from gensim
-from gensim.summarization import summarize, keywords
+# Import the sentence splitter, which segments a list of sections in one call
+from sentences import split_sentences, split_batch
 
 # Import ElementTree
 import xml.etree.ElementTree as ET
 
+# Import the full-text search index
+from search import SearchIndex
+
+# Import the corpus-wide TF-IDF keyword engine
+from tfidf import TfidfIndex, TOP_KEYWORDS, TOP_RELATED
+
+# Import the near-duplicate detector
+from dedup import MinHashIndex
+
+# Import the request coalescing layer for on-demand summaries
+from singleflight import SingleFlight
+
+# Import the memory-mapped store for the precompiled artifacts
+from store import SectionStore, write_store
+
+# Import hashlib to fingerprint section texts
+import hashlib
+
+# Import the tools for lazy, thread-safe summaries
+import threading
+import time
+
+# Import the process pool for the parallel build mode
+from concurrent.futures import ProcessPoolExecutor
+
+# Import the stage timers
+from metrics import timed, timer
+
+# Settings that change what get_summary and get_keyword return.
+# They are part of every cache key, so bump this string whenever
+# the summarizer changes and stale cache entries will simply miss.
+SUMMARY_SETTINGS = 'textrank-bm25;sentences=2;keyword=textrank-first;splitter=legal;long=1000/200/40;ranking=order'
+
+# The number of sentences in a summary, unless a length is asked for
+SUMMARY_SENTENCES = 2
+
+# The most summaries and keywords computed on demand at the same time
+FLIGHT_WORKERS = 2
+
+# Concurrent requests for the same summary share one computation
+flights = SingleFlight(workers=FLIGHT_WORKERS, name='sections')
+
+# The layout of the artifacts written by Volume.save.
+# Bump it whenever that layout changes.
+ARTIFACT_FORMAT = 'regsum-artifact-7'
+
 # Preprocessing: removing unwanted elements from the original XML
 def clean_xml(old_file, new_file):
     
@@ -110,6 +157,7 @@ def clean_xml(old_file, new_file):
 
 # Preprocessing: clean up the text by removing indexing,
 # citations, and newlines.
+@timed('preprocess')
 def preprocess(text):
     
     # Remove all indexing
@@ -125,38 +173,58 @@ def preprocess(text):
 
 #####################################################################
    
-def get_summary(text):
+def analyze_text(text, sentences=None):
+    
+    '''
+    Preprocess a section and split, tokenize and stem it once.
+    The result can be passed to both get_summary and get_keyword.
+    The sentences of the preprocessed text may already be known.
+    '''
+    
+    return analyze(preprocess(text), sentences)
+
+#####################################################################
+   
+def get_ranking(text, analysis=None):
+    
+    '''
+    Rank the sentences of a section once. Summaries of
+    any length are then taken from the ranking.
+    '''
+    
+    # preprocess and tokenize the text (unless that is already done)
+    if analysis is None:
+        analysis = analyze_text(text)
+    
+    return rank(analysis)
 
-    # preprocess the text
-    prepro = preprocess(text)
-        
-    # count the sentences
-    sentences = sent_tokenize(prepro)
-    sent_count = len(sentences)
-        
-    # compute the summary to text ratio
-    ratio = 2 / sent_count # looking for one or two sentences per section
+#####################################################################
+   
+def get_summary(text, analysis=None, ranking=None, length=SUMMARY_SENTENCES):
 
-    # call the summarize function
-    summary = summarize(prepro, ratio)
+    # rank the sentences (unless that is already done)
+    if ranking is None:
+        ranking = get_ranking(text, analysis)
+        
+    # take the best sentences: one or two per section,
+    # unless another length is asked for
+    summary = ranking.select(sentences=length)
         
     return summary
 
 #####################################################################
     
-def get_keyword(text):
-    
-    # preprocess the text
-    prepro = preprocess(text)
+def get_keyword(text, analysis=None):
     
-    # get a string of keywords
-    kw_string = keywords(prepro)
+    # preprocess and tokenize the text (unless that is already done)
+    if analysis is None:
+        analysis = analyze_text(text)
     
-    # split the string to form a list
-    kw_list = kw_string.split('\n')
+    # get a list with the best keyword
+    kw_list = keywords_analysis(analysis, words=1, split=True)
     
     # take the first element in the list
-    keyword = kw_list[0]
+    keyword = kw_list[0] if kw_list else ''
     
     # make it lowercase
     keyword = keyword.lower()
@@ -165,18 +233,166 @@ def get_keyword(text):
     
 #####################################################################
 
+def get_keywords(texts, k=TOP_KEYWORDS):
+    
+    '''
+    The top k keywords of every text, as lists of (keyword, score),
+    best first. The texts are weighed against each other with
+    TF-IDF, so pass every section of a volume in one call.
+    '''
+    
+    return TfidfIndex([preprocess(text) for text in texts]).keywords(k)
+    
+#####################################################################
+
+def iter_sections(filename):
+    
+    '''
+    A generator that reads a CFR volume one SECTION at a time
+    and yields (number, text) for each part.
+    
+    The file is read with iterparse, and every element is
+    cleared and detached from its parent as soon as it has
+    been processed, so memory stays flat no matter how big
+    the volume is. The texts can be fed straight into
+    summarize_section without ever building a Volume.
+    '''
+    
+    stack = [] # the open elements, from the root down
+    in_section = False
+    number_now = None # the part currently being collected
+    paragraphs = []
+    
+    for event, element in ET.iterparse(filename, events=('start', 'end')):
+        
+        if event == 'start':
+            stack.append(element)
+            if element.tag == 'SECTION':
+                in_section = True
+            continue
+        
+        stack.pop()
+        
+        if element.tag == 'SECTION':
+            in_section = False
+            section = element.find('SECTNO').text # Get the section number
+            number = re.sub(r'[^0-9\-\.]', '', section) # Trim the number
+            number = re.sub(r'\..*$', '', number) # Ignore subsection numbers
+            number = int(number) # convert to integer
+            
+            # A new part: hand over the one we have been collecting
+            if number != number_now and number_now is not None:
+                yield (number_now, ' '.join(paragraphs))
+                paragraphs = []
+            number_now = number
+            
+            for child in element:
+                if child.tag == 'P': # get all the paragraphs
+                    text = re.sub(r'^\(.*[0-9].*\)', '', child.text)
+                    paragraphs.append(text) # append text to the list
+        
+        # Children of a SECTION are needed until the SECTION ends.
+        # Everything else can be thrown away right now.
+        if not in_section:
+            element.clear()
+            if stack:
+                stack[-1].remove(element)
+    
+    # Hand over the last part
+    if number_now is not None:
+        yield (number_now, ' '.join(paragraphs))
+    
+#####################################################################
+
+def fingerprint(text):
+    
+    # A hash of the section text, to tell whether it has changed
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+    
+#####################################################################
+
+def summarize_section(text):
+    
+    '''
+    Compute the summary, keyword and sentence ranking of
+    one section. This is the unit of work sent to each
+    worker process when a Volume is built in parallel.
+    '''
+    
+    analysis = analyze_text(text) # read the text only once
+    ranking = get_ranking(text, analysis)
+    return (get_summary(text, ranking=ranking), get_keyword(text, analysis), ranking)
+    
+#####################################################################
+
+def adapt_ranking(ranking, sentences, keep=SUMMARY_SENTENCES):
+    
+    '''
+    Rank the sentences of a text with the ranking of a nearly
+    identical text: the sentences they share keep the order of
+    that ranking, and the others follow in document order.
+    Returns None when any of the keep best sentences of the
+    ranking is missing from the text, since the summary would
+    then be built from the new sentences without ranking them.
+    '''
+    
+    position = {} # sentence -> its first index in this text
+    for i, sentence in enumerate(sentences):
+        position.setdefault(sentence, i)
+    
+    for i in ranking.order[:keep]:
+        if ranking.sentences[i] not in position:
+            return None
+    
+    order = []
+    taken = set()
+    for i in ranking.order:
+        j = position.get(ranking.sentences[i])
+        if j is not None and j not in taken:
+            order.append(j)
+            taken.add(j)
+    order.extend(j for j in range(len(sentences)) if j not in taken)
+    return Ranking(sentences, order)
+    
+#####################################################################
+
 class Section():
 
     '''
-    A Section object shall have four properties:
+    A Section object shall have six properties:
         - section number
         - original text
         - summary text
         - keyword
+        - keywords: the top TF-IDF keywords, with scores
+        - related: the numbers of the most similar sections, with scores
+    
+    The summary and keyword are computed the first time
+    they are accessed, not when the Section is created.
+    Most users only open a few sections, so there is no
+    reason to summarize the whole volume up front.
+    
+    The ranking of the sentences is kept as well, so a
+    summary of another length (summary_of) is instant.
+    
+    Two Flask requests arriving at the same time never
+    compute the same value twice: the single-flight layer
+    (flights) makes the second one wait for the first one's
+    result, and runs the work on a small, bounded pool.
+    
+    A section whose text is nearly the same as another one
+    (its original) adapts the original's ranking instead of
+    running TextRank: it keeps the original's order for the
+    sentences it shares with it, and puts its own new sentences
+    last. If one of the original's summary sentences is not in
+    its text, the differences matter and it is ranked itself.
+    It keeps the original's keyword only if the word is in its
+    own text. A summary therefore never shows another section's
+    sentences.
     '''
     
     
-    def __init__(self, number, text):
+    def __init__(self, number, text, summary=None, keyword=None, cache=None, cache_key=None, order=None):
         
         # number: simply the section number as indicated in the text
         self.number = number
@@ -184,24 +400,197 @@ class Section():
         # text: the raw text of the section
         self.text = text
         
+        # summary and keyword: filled in on first access
+        # (or passed in when they were found in the cache)
+        self._summary = summary
+        self._keyword = keyword
+        
+        # Where to store the results once both are known
+        self.cache = cache
+        self.cache_key = cache_key
+        
+        # original: a near-identical Section whose results are reused
+        self.original = None
+        
+        # analysis: the tokenized text, shared by the summary and
+        # keyword and dropped once both have been computed
+        self._analysis = None
+        
+        # ranking: the sentences, best first, for summaries of any length
+        self._ranking = None
+        
+        # order: the ranking found in the cache, as sentence indexes
+        self._order = order
+        
+        # sentences: the preprocessed text split into sentences,
+        # shared by the analysis and the ranking
+        self._sentences = None
+        
+        # keywords: (keyword, score) pairs, best first. They are weighed
+        # against the whole volume, so the Volume fills them in.
+        self.keywords = None
+        
+        # related: (number, similarity) pairs of the most similar
+        # sections, best first, also filled in by the Volume
+        self.related = None
+        
+        # latency: seconds spent computing each value on first access
+        self.latency = {}
+        
+        # (re-entrant, because the summary needs the ranking)
+        self.lock = threading.RLock()
+        
+    @property
+    def summary(self):
+        
         # summary: a summary of the section text
-        self.summary = get_summary(text)
+        if self._summary is None:
+            self._compute('summary', self._summary_from_ranking)
+        return self._summary
+    
+    @property
+    def sentences(self):
+        
+        # sentences: split on first use, unless the Volume split
+        # a whole batch of sections at once (see Volume.warm)
+        if self._sentences is None:
+            self._sentences = split_sentences(preprocess(self.text))
+        return self._sentences
+    
+    @property
+    def ranking(self):
+        
+        # ranking: the sentences of the section, best first
+        if self._ranking is None:
+            if self._order is not None:
+                # Ranked before: only the sentences are needed again
+                with self.lock:
+                    if self._ranking is None:
+                        self._ranking = Ranking(self.sentences, self._order)
+            else:
+                self._compute('ranking', get_ranking)
+        return self._ranking
+    
+    def sentence_count(self):
+        
+        # The number of sentences, without building the ranking if it can be helped
+        if self._ranking is not None:
+            return len(self._ranking.sentences)
+        if self._order is not None:
+            return len(self._order) # every sentence has a place in the order
+        return len(self.ranking.sentences)
+    
+    def summary_of(self, length):
+        
+        '''
+        A summary of the given number of sentences.
+        Only the first call computes anything.
+        '''
+        
+        if length == SUMMARY_SENTENCES:
+            return self.summary
+        return get_summary(self.text, ranking=self.ranking, length=length)
+    
+    def _summary_from_ranking(self, text, analysis):
+        return get_summary(text, ranking=self.ranking)
+    
+    @property
+    def keyword(self):
         
         # keyword: the word that is most relevant to the sectiom
-        self.keyword = get_keyword(text)
+        if self._keyword is None:
+            self._compute('keyword', get_keyword)
+        return self._keyword
+    
+    def computed(self):
+        
+        # Check if both the summary and keyword are known
+        return self._summary is not None and self._keyword is not None
+    
+    def fill(self, summary, keyword, ranking=None):
+        
+        '''
+        Store a summary and keyword (and the ranking, if known)
+        computed elsewhere, for example in a worker process.
+        '''
+        
+        with self.lock:
+            self._summary = summary
+            self._keyword = keyword
+            if ranking is not None:
+                self._ranking = ranking
+            if self.cache is not None:
+                self.cache.put(self.cache_key, summary, keyword, self._cached_order())
+    
+    def _compute(self, name, function):
         
+        # One computation per section and value, on the bounded pool
+        flights.do((id(self), name), self._compute_now, name, function)
+    
+    def _compute_now(self, name, function):
+        
+        with self.lock:
+            
+            # Another thread may have finished while we waited
+            if getattr(self, '_' + name) is not None:
+                return
+            
+            start = time.perf_counter()
+            value = None
+            if self.original is not None:
+                # A near-duplicate: adapt what the original computed (once)
+                value = self._from_original(name)
+            if value is None:
+                if self._analysis is None:
+                    self._analysis = analyze_text(self.text, self.sentences)
+                value = function(self.text, self._analysis)
+            self.latency[name] = time.perf_counter() - start
+            setattr(self, '_' + name, value)
+            
+            if self._summary is not None and self._keyword is not None:
+                self._analysis = None
+            
+            # Once both values exist, remember them for the next restart
+            if self.cache is not None and self._summary is not None and self._keyword is not None:
+                self.cache.put(self.cache_key, self._summary, self._keyword, self._cached_order())
+    
+    def _from_original(self, name):
+        
+        # The value adapted from the original, or None to compute it
+        if name == 'ranking':
+            return adapt_ranking(self.original.ranking, self.sentences)
+        if name == 'keyword':
+            keyword = self.original.keyword
+            if keyword and re.search(r'\b%s\b' % re.escape(keyword), self.text.lower()):
+                return keyword
+            return None
+        return self._summary_from_ranking(self.text, None)
+    
+    def _cached_order(self):
+        
+        # The ranking to store in the cache, if it is known
+        return list(self._ranking.order) if self._ranking is not None else None
+        
+    def keyword_set(self):
+        
+        # The keyword and every TF-IDF keyword, in lowercase
+        words = {self.keyword.lower()}
+        for word, score in self.keywords or []:
+            words.add(word.lower())
+        return words
+    
     def keyword_match(self, keyword):
         
         '''
         Check if a word input by the user
-        matches the keyword of the section.
+        matches one of the keywords of the section.
         
         Not case-sensitive since both the user
-        input and keyword attribute are converted
+        input and keywords are converted
         to lowercase for the comparison
         '''
         
-        return keyword.lower() == self.keyword.lower()
+        return keyword.lower() in self.keyword_set()
         
     def number_match(self, number):
         
@@ -220,68 +609,448 @@ class Volume():
     A Volume object contains a collection of Section objects.
     
     It offers functionality to search for a section by
-    number or keyword.
+    number or keyword, and a ranked free-text search.
     
     The constructor accepts the name of the XML file
-    from which the Volume object will be created
+    from which the Volume object will be created,
+    and optionally a SummaryCache that is consulted
+    before any section is summarized. More files can
+    be added with the read method.
+    
+    Volume.load opens a precompiled artifact instead,
+    which needs no parsing or summarizing at all.
+    
+    Building a Volume only parses the XML. Summaries and
+    keywords are computed when a section is first opened,
+    or ahead of time with the warm method.
+    
+    Passing workers=N summarizes every section up front,
+    spread over N processes.
+    
+    While sections are read, near-duplicates of sections read
+    before them are found with MinHash, and they adapt the
+    ranking of their original (dedup=False turns this off).
     '''
 
-    def __init__(self, filename):
+    def __init__(self, filename=None, cache=None, workers=0, dedup=True):
         
-        # Create an ElementTree for the XML file
-        tree = ET.parse(filename)
+        self.sections = [] # Initialize a list to hold the Section objects
+        self.by_number = {} # number -> Section
+        self.by_keyword = None # keyword -> list of Sections, built on the first keyword search
+        self.tfidf = None # TF-IDF weights of every section, built with the keywords
+        self.search_index = None # full-text index, built on the first text search
+        self.stored_fingerprints = None # number -> fingerprint, when loaded from an artifact
+        self.index_lock = threading.Lock()
         
-        # Get the root node
-        root = tree.getroot()
-
-        # Create an iterator to iterate through the elements
-        CFR_iter = root.iter()
-        doc_dict = {} # dictionary to hold sections and respective text
-
-        for element in CFR_iter:
-            if element.tag == 'SECTION':
-                section = element.find('SECTNO').text # Get the section number
-                number = re.sub(r'[^0-9\-\.]', '', section) # Trim the number
-                number = re.sub(r'\..*$', '', number) # Ignore subsection numbers
-                number = int(number) # convert to integer
-                if number not in doc_dict.keys(): # new section = new key
-                    doc_dict[number] = [] # new section: start with an empty list
-                for child in element.getchildren():
-                    if child.tag == 'P': # get all the paragraphs
-                        text = re.sub(r'^\(.*[0-9].*\)', '', child.text)
-                        doc_dict[number].append(text) # append text to the list
-        
-        sections = [] # Initialize a list to hold the Section objects
-        
-        for key in doc_dict.keys(): # Iterate through the dictionary
+        # MinHash signatures of the sections read so far
+        self.near_duplicates = MinHashIndex() if dedup else None
+        
+        # Without a file name the Volume starts out empty
+        if filename is not None:
+            self.read(filename, cache)
+        
+        # Parallel build mode: summarize everything now
+        if workers > 0:
+            self.warm(workers=workers)
+        
+    def read(self, filename, cache=None):
+        
+        '''
+        Add the sections of an XML file to the Volume.
+        
+        Sections are known by their part number alone, and
+        part numbers repeat from one CFR title to the next,
+        so every file must hold other parts than those already
+        in the Volume (the volumes of one title, say). A file
+        that repeats a part raises ValueError and adds nothing.
+        '''
+        
+        # Read the sections one at a time from the XML file.
+        # Parts that appear more than once are joined together.
+        texts = {}
+        with timer('xml_parse'):
+            for number, text in iter_sections(filename):
+                if number in texts.keys():
+                    texts[number] = texts[number] + ' ' + text
+                else:
+                    texts[number] = text
+        
+        # Refuse to mix up two parts that share a number
+        repeated = sorted(number for number in texts if number in self.by_number)
+        if repeated:
+            raise ValueError("%s repeats parts already in the Volume (%s); "
+                             "a Volume holds the parts of a single CFR title"
+                             % (filename, ', '.join(str(number) for number in repeated)))
+        
+        # Look up every section in the cache in one go.
+        # The key is a hash of the preprocessed text and the settings.
+        if cache is not None:
+            cache_keys = {}
+            for key in texts.keys():
+                cache_keys[key] = cache.make_key(preprocess(texts[key]), SUMMARY_SETTINGS)
+            with timer('cache_lookup'):
+                cached = cache.get_many(cache_keys.values())
+        
+        for key in texts.keys(): # Iterate through the dictionary
             number = key # The keys are the numbers of each section
-            text = ' '.join(doc_dict[key]) # The texts are the values, join lists into strings
-            section = Section(number, text) # Instantiate an object for each section, and...
-            sections.append(section) # append it to the Volume sections list
+            text = texts[key]
+            if cache is None:
+                section = Section(number, text) # Instantiate an object for each section, and...
+            elif cache_keys[key] in cached:
+                summary, keyword, order = cached[cache_keys[key]] # Cache hit: nothing to compute
+                section = Section(number, text, summary, keyword, order=order)
+            else:
+                # Cache miss: summarized on first access, then stored
+                section = Section(number, text, cache=cache, cache_key=cache_keys[key])
+            self.add_section(section) # add it to the Volume and its indexes
         
-        self.sections = sections # That list becomes the attribute of the Volume object.
+            # Near-duplicates of earlier sections adapt their ranking
+            if self.near_duplicates is not None:
+                with timer('dedup'):
+                    signature = self.near_duplicates.signature(text)
+                    if not section.computed():
+                        match = self.near_duplicates.query(text, signature)
+                        if match is not None:
+                            original = match[0]
+                            section.original = original.original or original
+                    self.near_duplicates.add(section, text, signature)
+    
+    def save(self, filename):
         
-    def search_by_number(self, number):
+        '''
+        Write the Volume to a precompiled artifact: the text,
+        summary and keyword of every section plus the keyword
+        and full-text indexes. Every summary is computed first.
+        '''
+        
+        # Make sure nothing is left to compute after loading
+        self.search_by_keyword('')
+        self.search('')
+        self.relate_sections()
+        
+        position = {} # id of each Section -> its place in the list
+        for i, section in enumerate(self.sections):
+            position[id(section)] = i
+        
+        # The indexes and settings are stored after the sections
+        metadata = {
+            'format': ARTIFACT_FORMAT,
+            'settings': SUMMARY_SETTINGS,
+            'by_keyword': {keyword: [position[id(section)] for section in matches]
+                           for keyword, matches in self.by_keyword.items()},
+            'keywords': [section.keywords for section in self.sections],
+            'related': [section.related for section in self.sections],
+            'fingerprints': self.fingerprints(),
+        }
+        
+        rows = ((section.number, section.text, section.summary, section.keyword, section.ranking)
+                for section in self.sections)
+        with timer('artifact_save'):
+            write_store(filename, rows, metadata,
+                        self.search_index.postings, self.search_index.lengths)
+    
+    @classmethod
+    @timed('artifact_load')
+    def load(cls, filename):
+        
+        '''
+        Open an artifact written by save (or by "regsum.py build").
+        Nothing is parsed or summarized: the sections and
+        indexes are used exactly as they were stored.
+        
+        The sections are SectionViews over a memory-mapped
+        SectionStore, so every process that loads the same
+        artifact shares one copy of the text and summaries, and
+        the full-text search reads its postings from the same
+        map. The keywords, related sections and keyword index
+        are unpickled into each process; they are a few short
+        entries per section.
+        '''
+        
+        store = SectionStore(filename)
+        metadata = store.metadata()
+        
+        if metadata['format'] != ARTIFACT_FORMAT or metadata['settings'] != SUMMARY_SETTINGS:
+            raise ValueError("%s was built by a different version of RegSum, please rebuild it" % filename)
+        
+        volume = cls()
+        for section, keywords, related in zip(store.views(), metadata['keywords'], metadata['related']):
+            section.keywords = keywords
+            section.related = related
+            volume.add_section(section)
+        
+        volume.by_keyword = {}
+        for keyword, positions in metadata['by_keyword'].items():
+            volume.by_keyword[keyword] = [volume.sections[i] for i in positions]
+        
+        volume.search_index = SearchIndex()
+        volume.search_index.sections = list(volume.sections)
+        volume.search_index.postings = store.postings()
+        volume.search_index.lengths = store.lengths()
+        volume.search_index.total_length = sum(volume.search_index.lengths)
+        
+        volume.stored_fingerprints = metadata['fingerprints']
+        
+        return volume
+    
+    def fingerprints(self):
+        
+        '''
+        Returns a dictionary of section number -> fingerprint of its text.
+        '''
+        
+        if self.stored_fingerprints is not None:
+            return dict(self.stored_fingerprints)
+        
+        prints = {}
+        for section in self.sections:
+            prints[section.number] = fingerprint(section.text)
+        return prints
+    
+    def reuse(self, previous):
+        
+        '''
+        Take the summary, keyword and sentence ranking of every
+        section whose text has not changed since a previous edition
+        (another Volume, usually opened with Volume.load). Only the
+        sections that were added or changed are left to summarize.
+        
+        Returns a dictionary with the lists of 'added', 'removed'
+        and 'changed' section numbers and the 'unchanged' count.
+        '''
+        
+        old_prints = previous.fingerprints()
+        report = {'added': [], 'removed': [], 'changed': [], 'unchanged': 0}
+        
+        for section in self.sections:
+            if section.number not in old_prints:
+                report['added'].append(section.number)
+            elif fingerprint(section.text) != old_prints[section.number]:
+                report['changed'].append(section.number)
+            else:
+                # Unchanged: take everything, even over a cache hit
+                # (whose entry may predate the stored ranking)
+                old_section = previous.search_by_number(section.number)[1]
+                section.fill(old_section.summary, old_section.keyword, old_section.ranking)
+                report['unchanged'] += 1
+        
+        for number in old_prints:
+            if number not in self.by_number:
+                report['removed'].append(number)
+        
+        return report
+        
+    def warm(self, numbers=None, workers=0, progress=None):
+        
+        '''
+        Compute the summary and keyword of the given sections
+        (or of every section) ahead of the first request.
+        
+        With workers > 0 the sections are sent to a pool of
+        worker processes in chunks. The results come back in
+        document order and are stored on each section.
+        
+        progress, if given, is called with (done, total)
+        after each section.
+        '''
+        
+        # Only sections that still have something to compute
+        pending = []
+        for section in self.sections:
+            if numbers is None or section.number in numbers:
+                if not section.computed():
+                    pending.append(section)
+        
+        if workers <= 0 or len(pending) < 2:
+            
+            # Segment every section that needs it in one batch
+            unsplit = [section for section in pending if section._sentences is None]
+            if unsplit:
+                texts = [preprocess(section.text) for section in unsplit]
+                for section, sentences in zip(unsplit, split_batch(texts)):
+                    section._sentences = sentences
+            
+            for done, section in enumerate(pending, 1):
+                section.summary
+                section.keyword
+                if progress is not None:
+                    progress(done, len(pending))
+        else:
+            self._warm_parallel(pending, workers, progress)
+        
+        # The volume-wide keywords and related sections, unless they
+        # are already known (always, for an artifact from Volume.load)
+        if numbers is None:
+            if any(section.keywords is None for section in self.sections):
+                self.rank_keywords()
+            self.relate_sections()
+    
+    def _warm_parallel(self, pending, workers, progress):
+        
+        # Near-duplicates wait for their original, the rest go to the pool
+        duplicates = [section for section in pending if section.original is not None]
+        pending = [section for section in pending if section.original is None]
+        
+        # A few chunks per worker keeps the pool busy
+        # without paying the pickling cost for every section.
+        chunksize = max(1, len(pending) // (workers * 4))
+        texts = [section.text for section in pending]
+        total = len(pending) + len(duplicates)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(summarize_section, texts, chunksize=chunksize)
+            for done, (section, (summary, keyword, ranking)) in enumerate(zip(pending, results), 1):
+                section.fill(summary, keyword, ranking)
+                if progress is not None:
+                    progress(done, total)
+        
+        # Adapting an original's ranking is quick, so it is done here
+        for done, section in enumerate(duplicates, len(pending) + 1):
+            section.summary
+            section.keyword
+            if progress is not None:
+                progress(done, total)
+    
+    def dedup_report(self):
+        
+        '''
+        Returns a dictionary with the number of 'sections', the
+        number of near-'duplicates' that adapt the ranking of an
+        original section, their 'ratio', and the 'pairs' of
+        (duplicate number, original number).
+        '''
+        
+        pairs = [(section.number, section.original.number) for section in self.sections
+                 if getattr(section, 'original', None) is not None]
+        return {'sections': len(self.sections),
+                'duplicates': len(pairs),
+                'ratio': len(pairs) / len(self.sections) if self.sections else 0.0,
+                'pairs': pairs}
+    
+    def latency_report(self):
+        
+        '''
+        Returns a list of (number, summary seconds, keyword seconds)
+        for every section computed so far, slowest first.
+        Sections loaded from the cache do not appear.
+        '''
         
+        report = []
         for section in self.sections:
-            if section.number == number:
-                return (True, section)
+            if section.latency:
+                report.append((section.number,
+                               section.latency.get('summary', 0.0),
+                               section.latency.get('keyword', 0.0)))
+        report.sort(key=lambda row: row[1] + row[2], reverse=True)
+        return report
+        
+    def add_section(self, section):
+        
+        '''
+        Append a Section to the Volume and keep the indexes up to date.
+        The section numbers are unique: adding a second section
+        with the same number raises ValueError.
+        
+        The number and full-text indexes take the section in place.
+        The keyword index cannot: a new section changes the TF-IDF
+        weight of every term, and so the keywords of every section.
+        It is dropped instead, and rebuilt (with the TF-IDF weights)
+        by the next keyword search, save or warm. Adding one section
+        at a time between keyword searches is therefore costly; read
+        whole files, as Volume.read does, and search afterwards.
+        '''
+        
+        with self.index_lock:
+            if section.number in self.by_number:
+                raise ValueError("the Volume already has a section %d" % section.number)
+            self.sections.append(section)
+            self.by_number[section.number] = section
+            self.by_keyword = None
+            self.tfidf = None
+            if self.search_index is not None:
+                self.search_index.add(section)
         
-        return (False, None)
+    def search_by_number(self, number):
+        
+        section = self.by_number.get(number)
+        if section is None:
+            return (False, None)
+        
+        return (True, section)
+    
+    def rank_keywords(self, k=TOP_KEYWORDS):
+        
+        '''
+        Weigh the terms of every section against the whole
+        Volume with TF-IDF, in one batched pass, and give each
+        section its top k (keyword, score) pairs.
+        '''
+        
+        with self.index_lock:
+            if self.tfidf is not None:
+                return
+            texts = [preprocess(section.text) for section in self.sections]
+            self.tfidf = TfidfIndex(texts)
+            for section, keywords in zip(self.sections, self.tfidf.keywords(k)):
+                section.keywords = keywords
+    
+    def relate_sections(self, k=TOP_RELATED):
+        
+        '''
+        Give each section the k sections most similar to it
+        (by the cosine similarity of their TF-IDF weights) as
+        (number, similarity) pairs. The similarities are
+        computed in blocks, never as one all-pairs matrix.
+        '''
+        
+        if all(section.related is not None for section in self.sections):
+            return
+        self.rank_keywords()
+        with self.index_lock:
+            related = self.tfidf.related(k)
+            for section, pairs in zip(self.sections, related):
+                section.related = [(self.sections[row].number, score) for row, score in pairs]
     
     def search_by_keyword(self, keyword):
         
         '''
-        Accepts a keyword and returns a list of sections whose keyword matches the input.
+        Accepts a keyword and returns a list of sections
+        with a keyword (or TF-IDF keyword) that matches the input.
+        
+        The first search builds an inverted index of keyword -> sections
+        (which needs the keywords of every section). Later searches
+        are a single dictionary lookup.
+        '''
+        
+        if self.by_keyword is None:
+            if any(section.keywords is None for section in self.sections):
+                self.rank_keywords()
+            with self.index_lock:
+                if self.by_keyword is None:
+                    by_keyword = {}
+                    for section in self.sections:
+                        for word in sorted(section.keyword_set()):
+                            by_keyword.setdefault(word, []).append(section)
+                    self.by_keyword = by_keyword
+        
+        return list(self.by_keyword.get(keyword.lower(), []))
+    
+    def search(self, query, k=10):
+        
+        '''
+        Free-text search over the text of every section.
+        Returns up to k (score, section) pairs ranked by BM25, best first.
+        Words in double quotes must appear together as a phrase.
         '''
         
-        match_list = [] # Initialize the list of matches
+        if self.search_index is None:
+            with self.index_lock:
+                if self.search_index is None:
+                    search_index = SearchIndex()
+                    for section in self.sections:
+                        search_index.add(section)
+                    self.search_index = search_index
         
-        for section in self.sections: # Iterate through the sections.
-            if section.keyword == keyword: # If there is a match,...
-                match_list.append(section) # ...append that section to the list.
-            
-        return match_list
+        return self.search_index.search(query, k)
     
     
     
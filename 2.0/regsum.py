@@ -0,0 +1,87 @@
+'''
+RegSum command line tool.
+
+    python regsum.py build -o CFR.regsum CFR_Title13_Volume1.xml [more.xml ...]
+
+compiles one or more CFR XML files of the same title (their part
+numbers must not repeat) into a single precompiled artifact with the text, summary and keyword of every section
+and the search indexes. The Flask application opens the
+artifact with Volume.load, so it does no NLP work at boot.
+
+    python regsum.py build -o CFR-2020.regsum --previous CFR-2019.regsum CFR-2020.xml
+
+builds a new edition incrementally: sections whose text is the
+same as in the previous artifact keep their summary and keyword,
+and only added or changed sections are summarized.
+'''
+
+###############################
+import argparse
+import time
+from functions import Volume
+from cache import SummaryCache
+###############################
+
+def build(args):
+
+    start = time.perf_counter()
+
+    # The cache makes rebuilding after a small change quick
+    cache = None
+    if args.cache:
+        cache = SummaryCache(args.cache)
+
+    # Read every file into one Volume
+    volume = Volume()
+    for filename in args.files:
+        print("Reading %s..." % filename)
+        try:
+            volume.read(filename, cache)
+        except ValueError as error:
+            raise SystemExit("regsum: %s" % error)
+
+    # Near-duplicates adapt the ranking of their original
+    report = volume.dedup_report()
+    print("%d of %d sections are near-duplicates (%.1f%%)"
+          % (report['duplicates'], report['sections'], 100 * report['ratio']))
+
+    # Reuse everything that has not changed since the previous edition
+    if args.previous:
+        report = volume.reuse(Volume.load(args.previous))
+        print("%d unchanged, %d changed, %d added, %d removed"
+              % (report['unchanged'], len(report['changed']),
+                 len(report['added']), len(report['removed'])))
+        for name in ['changed', 'added', 'removed']:
+            if report[name]:
+                print("  %s: %s" % (name, ', '.join(str(number) for number in report[name])))
+
+    # Summarize every section, in parallel if asked to
+    print("Summarizing %d sections..." % sum(1 for section in volume.sections if not section.computed()))
+    volume.warm(workers=args.workers)
+
+    volume.save(args.output)
+    print("Wrote %s in %.1f s" % (args.output, time.perf_counter() - start))
+
+#####################################################################
+
+def main():
+
+    parser = argparse.ArgumentParser(prog='regsum', description='RegSum command line tool')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = commands.add_parser('build', help='compile CFR XML files into an artifact')
+    build_parser.add_argument('files', nargs='+', help='CFR XML files')
+    build_parser.add_argument('-o', '--output', required=True, help='artifact to write')
+    build_parser.add_argument('-w', '--workers', type=int, default=0,
+                              help='number of worker processes (default: summarize in this process)')
+    build_parser.add_argument('--cache', default=None,
+                              help='SummaryCache file to reuse summaries from')
+    build_parser.add_argument('--previous', default=None,
+                              help='artifact of the previous edition to reuse unchanged sections from')
+    build_parser.set_defaults(run=build)
+
+    args = parser.parse_args()
+    args.run(args)
+
+if __name__ == '__main__':
+    main()
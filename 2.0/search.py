@@ -0,0 +1,145 @@
+'''
+Defines the SearchIndex class.
+
+A SearchIndex object is a positional inverted index over
+the text of a collection of sections. For every stemmed
+term it stores the sections that contain it and the word
+positions at which it appears.
+
+Free-text queries are ranked with Okapi BM25 (the same
+scoring function TextRank uses to compare sentences), and
+only the best k results are kept, using a heap.
+A query in double quotes only matches sections that contain
+the words as a phrase, which is what the positions are for.
+
+An index loaded from an artifact reads its postings from the
+memory-mapped file (a PackedPostings) and is read-only until
+a section is added to it, which copies them into a dictionary.
+'''
+
+###############################
+import bisect
+import heapq
+import math
+import re
+from textrank import RE_WORD, STOPWORDS, stem_word
+###############################
+
+# Okapi BM25 parameters for ranking whole sections
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+#####################################################################
+
+def index_terms(text):
+
+    '''
+    Returns a list of (stem, position) for the words of the text.
+    Stop words are skipped but still counted, so that positions
+    reflect where each word really is.
+    '''
+
+    terms = []
+    for position, word in enumerate(RE_WORD.findall(text.lower())):
+        if len(word) < 3 or word in STOPWORDS:
+            continue
+        terms.append((stem_word(word), position))
+    return terms
+
+#####################################################################
+
+class SearchIndex():
+
+    def __init__(self):
+
+        # term -> {document id: [positions]}
+        self.postings = {}
+
+        # The indexed sections and the number of terms in each
+        self.sections = []
+        self.lengths = []
+        self.total_length = 0
+
+    def add(self, section):
+
+        # Postings read from an artifact cannot grow: copy them first
+        if not isinstance(self.postings, dict):
+            self.postings = dict(self.postings.items())
+            self.lengths = list(self.lengths)
+
+        # Index one more section
+        doc = len(self.sections)
+        self.sections.append(section)
+
+        terms = index_terms(section.text)
+        for stem, position in terms:
+            self.postings.setdefault(stem, {}).setdefault(doc, []).append(position)
+
+        self.lengths.append(len(terms))
+        self.total_length += len(terms)
+
+    def __len__(self):
+        return len(self.sections)
+
+    def search(self, query, k=10):
+
+        '''
+        Returns up to k (score, section) pairs, best first.
+        '''
+
+        # Quoted parts of the query must appear as phrases
+        phrases = [index_terms(phrase) for phrase in re.findall(r'"([^"]*)"', query)]
+        stems = [stem for stem, position in index_terms(query.replace('"', ' '))]
+
+        n = len(self.sections)
+        if n == 0 or not stems:
+            return []
+        avgdl = self.total_length / n
+
+        # Look every term up once, for the scores and the phrases
+        postings = {stem: self.postings.get(stem) or {} for stem in set(stems)}
+
+        # Add up the BM25 contribution of each query term
+        scores = {}
+        for stem, docs in postings.items():
+            if not docs:
+                continue
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc, positions in docs.items():
+                tf = len(positions)
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[doc] / avgdl)
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        # Drop the sections that do not contain every phrase
+        for phrase in phrases:
+            if phrase:
+                scores = {doc: score for doc, score in scores.items()
+                          if self.has_phrase(doc, phrase, postings)}
+
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(score, self.sections[doc]) for doc, score in best]
+
+    def has_phrase(self, doc, phrase, postings=None):
+
+        '''
+        Check if the (stem, position) terms of a phrase appear in
+        a section with the same spacing between them. postings
+        may hold the lists of the phrase terms, already looked up.
+        '''
+
+        if postings is None:
+            postings = self.postings
+        first_stem, first_position = phrase[0]
+        starts = postings.get(first_stem, {}).get(doc, [])
+        for start in starts:
+            found = True
+            for stem, position in phrase[1:]:
+                positions = postings.get(stem, {}).get(doc, [])
+                target = start + position - first_position
+                i = bisect.bisect_left(positions, target) # positions are sorted
+                if i == len(positions) or positions[i] != target:
+                    found = False
+                    break
+            if found:
+                return True
+        return False
@@ -0,0 +1,95 @@
+'''
+Defines the SingleFlight class.
+
+A SingleFlight object makes sure an expensive computation
+runs only once at a time per key. When a burst of requests
+asks for the summary of the same section, the first one
+starts the computation and the others wait for its result
+instead of starting their own.
+
+The computations run on a small, bounded pool of threads,
+so however many requests arrive, at most that many
+summaries are being computed at once and the rest of the
+Flask request threads stay free for pages that are already
+known.
+
+A computation that asks for another one (a summary needs
+the sentence ranking) runs the inner one directly on its own
+pool thread, so the pool can never deadlock waiting on itself.
+
+The computations started and the requests that joined one in
+flight are exported as the Prometheus counters
+regsum_single_flight_computed_total and
+regsum_single_flight_deduplicated_total, labelled with the
+name of the SingleFlight.
+'''
+
+###############################
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+###############################
+
+metrics.describe('regsum_single_flight_computed_total',
+                 'Computations started on the single-flight pool', 'flight')
+metrics.describe('regsum_single_flight_deduplicated_total',
+                 'Requests that joined a computation already in flight', 'flight')
+
+class SingleFlight():
+
+    def __init__(self, workers=2, name='default'):
+
+        self.name = name # the label of the counters
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='single-flight')
+        self.calls = {} # key -> Future of the computation in flight
+        self.lock = threading.Lock()
+        self.local = threading.local() # marks the pool threads
+
+        # Computations started, and requests that joined one in flight
+        self.computed = 0
+        self.deduplicated = 0
+
+    def do(self, key, function, *args):
+
+        '''
+        Return function(*args), computed only once for all
+        the callers that ask for the same key at the same time.
+        '''
+
+        # Already on a pool thread: just run it
+        if getattr(self.local, 'active', False):
+            return function(*args)
+
+        with self.lock:
+            future = self.calls.get(key)
+            joined = future is not None
+            if future is None:
+                future = self.executor.submit(self.run, key, function, args)
+                self.calls[key] = future
+                self.computed += 1
+            else:
+                self.deduplicated += 1
+        if joined:
+            metrics.count('regsum_single_flight_deduplicated_total', self.name)
+        else:
+            metrics.count('regsum_single_flight_computed_total', self.name)
+        return future.result()
+
+    def run(self, key, function, args):
+
+        # The work done on a pool thread
+        self.local.active = True
+        try:
+            return function(*args)
+        finally:
+            self.local.active = False
+            with self.lock:
+                self.calls.pop(key, None)
+
+    def stats(self):
+
+        # The counters, as a dictionary
+        with self.lock:
+            return {'computed': self.computed,
+                    'deduplicated': self.deduplicated,
+                    'in_flight': len(self.calls)}
@@ -0,0 +1,354 @@
+'''
+Defines the SectionStore and SectionView classes.
+
+A SectionStore is a read-only file holding the number, text,
+summary, keyword and ranked sentences of every section of a
+Volume, packed one after another as UTF-8, with a table of
+offsets, followed by the postings of the full-text index:
+
+    header | strings | offset table | postings | metadata
+
+The postings are arrays of offsets into the file (see
+write_postings), so a PackedPostings reads the list of one
+term straight from the map when a query needs it. Only the
+small per-section metadata (keywords, related sections, the
+keyword index and the fingerprints) is pickled, and that is
+unpickled into each process.
+
+The file is opened with mmap, so nothing is read until it
+is used, and every process that opens the same file (for
+example, each gunicorn worker) shares a single copy of it
+through the operating system's page cache.
+
+A SectionView looks like a Section but only remembers the
+store, its place in the table and its number. The text,
+summary, keyword and ranking are decoded from the file each
+time they are accessed.
+'''
+
+###############################
+import mmap
+import pickle
+import struct
+from array import array
+from textrank import Ranking
+###############################
+
+MAGIC = b'RGSMSTR2'
+
+# magic, number of sections, offset of the table, offset of the
+# postings, offset of the metadata
+HEADER = struct.Struct('<8sQQQQ')
+
+# number, offset of the text, and the byte lengths of the text,
+# summary, keyword, sentences and sentence order (stored one
+# after another)
+ENTRY = struct.Struct('<qQQQQQQ')
+
+# Each field of an entry, in the order it is stored
+FIELDS = ['text', 'summary', 'keyword', 'sentences', 'order']
+
+# number of terms, then the offsets of: the section lengths,
+# the term offsets, the terms, the list offsets and the lists
+POSTINGS = struct.Struct('<QQQQQQ')
+
+#####################################################################
+
+def write_store(filename, rows, metadata, postings=None, lengths=()):
+
+    '''
+    Write a SectionStore file.
+    rows is an iterable of (number, text, summary, keyword, ranking),
+    metadata is any picklable object (the indexes, for example),
+    postings and lengths are those of a SearchIndex over the rows.
+    '''
+
+    table = []
+    with open(filename, 'wb') as store_file:
+
+        # Leave room for the header, it is filled in at the end
+        store_file.write(b'\0' * HEADER.size)
+
+        offset = HEADER.size
+        for number, text, summary, keyword, ranking in rows:
+            # Sentences never contain a newline, so they are
+            # joined with one. The order is stored as 32-bit ints.
+            fields = [text.encode('utf-8'),
+                      summary.encode('utf-8'),
+                      keyword.encode('utf-8'),
+                      '\n'.join(ranking.sentences).encode('utf-8'),
+                      array('i', ranking.order).tobytes()]
+            for field in fields:
+                store_file.write(field)
+            table.append(ENTRY.pack(number, offset, *[len(field) for field in fields]))
+            offset += sum(len(field) for field in fields)
+
+        table_offset = offset
+        store_file.write(b''.join(table))
+
+        postings_offset = table_offset + ENTRY.size * len(table)
+        metadata_offset = write_postings(store_file, postings_offset, postings or {}, lengths)
+        pickle.dump(metadata, store_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        store_file.seek(0)
+        store_file.write(HEADER.pack(MAGIC, len(table), table_offset, postings_offset, metadata_offset))
+
+def write_postings(store_file, offset, postings, lengths):
+
+    '''
+    Write the postings of a SearchIndex at offset, and return
+    the offset just after them. The layout is:
+
+        - POSTINGS: the term count and the offsets below
+        - the number of terms in each section (32-bit ints)
+        - where each term starts in the terms (64-bit ints, one more
+          than the number of terms)
+        - the terms, in UTF-8, sorted by their bytes
+        - where the list of each term starts in the lists
+          (64-bit ints, counted in 32-bit ints, one more than the
+          number of terms)
+        - the lists: for each term and each section containing
+          it, the section, the number of positions and the
+          positions (32-bit ints)
+
+    Every array starts on an 8-byte boundary.
+    '''
+
+    items = sorted((term.encode('utf-8'), docs) for term, docs in postings.items())
+
+    term_index = array('Q', [0])
+    for term, docs in items:
+        term_index.append(term_index[-1] + len(term))
+    terms = b''.join(term for term, docs in items)
+
+    list_index = array('Q', [0])
+    lists = array('i')
+    for term, docs in items:
+        for doc in sorted(docs):
+            lists.append(doc)
+            lists.append(len(docs[doc]))
+            lists.extend(docs[doc])
+        list_index.append(len(lists))
+
+    parts = [array('i', lengths).tobytes(), term_index.tobytes(), terms,
+             list_index.tobytes(), lists.tobytes()]
+
+    # Lay the parts out after the POSTINGS header, 8-byte aligned
+    offsets = []
+    position = offset + POSTINGS.size
+    for part in parts:
+        position += -position % 8
+        offsets.append(position)
+        position += len(part)
+
+    store_file.write(POSTINGS.pack(len(items), *offsets))
+    written = offset + POSTINGS.size
+    for start, part in zip(offsets, parts):
+        store_file.write(b'\0' * (start - written))
+        store_file.write(part)
+        written = start + len(part)
+    return written
+
+#####################################################################
+
+class SectionStore():
+
+    def __init__(self, filename):
+
+        # Map the whole file read-only
+        with open(filename, 'rb') as store_file:
+            self.map = mmap.mmap(store_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic = self.map[:len(MAGIC)]
+        if magic != MAGIC:
+            raise ValueError("%s is not a RegSum section store, or an older version of one" % filename)
+        (magic, self.count, self.table_offset,
+         self.postings_offset, self.metadata_offset) = HEADER.unpack_from(self.map, 0)
+
+    def __len__(self):
+        return self.count
+
+    def entry(self, index):
+
+        # (number, text offset, then the length of each field)
+        return ENTRY.unpack_from(self.map, self.table_offset + index * ENTRY.size)
+
+    def number(self, index):
+        return self.entry(index)[0]
+
+    def field(self, index, name):
+
+        # The raw bytes of one field of one section
+        entry = self.entry(index)
+        lengths = entry[2:]
+        position = FIELDS.index(name)
+        start = entry[1] + sum(lengths[:position])
+        return self.map[start:start + lengths[position]]
+
+    def text(self, index):
+        return self.field(index, 'text').decode('utf-8')
+
+    def summary(self, index):
+        return self.field(index, 'summary').decode('utf-8')
+
+    def keyword(self, index):
+        return self.field(index, 'keyword').decode('utf-8')
+
+    def ranking(self, index):
+        sentences = self.field(index, 'sentences').decode('utf-8')
+        sentences = sentences.split('\n') if sentences else []
+        order = array('i')
+        order.frombytes(self.field(index, 'order'))
+        return Ranking(sentences, order.tolist())
+
+    def postings(self):
+
+        # The postings of the full-text index, read from the map
+        return PackedPostings(self)
+
+    def lengths(self):
+
+        # The number of terms in each section, for the full-text index
+        offset = POSTINGS.unpack_from(self.map, self.postings_offset)[1]
+        return memoryview(self.map)[offset:offset + 4 * self.count].cast('i')
+
+    def sentence_count(self, index):
+
+        # Every sentence has a place in the order, a 32-bit int each
+        return self.entry(index)[2 + FIELDS.index('order')] // array('i').itemsize
+
+    def metadata(self):
+
+        # Unpickle the metadata stored after the table
+        return pickle.loads(self.map[self.metadata_offset:])
+
+    def views(self):
+
+        # One SectionView per section, in order
+        return [SectionView(self, index) for index in range(self.count)]
+
+#####################################################################
+
+class PackedPostings():
+
+    '''
+    The postings of a SearchIndex, as stored by write_postings.
+    get(term) works like a dictionary lookup and decodes the
+    list of that one term: {section: [positions]}. Terms are
+    found by binary search over the sorted terms, and the
+    arrays are memoryviews of the map, so nothing is copied
+    into the process until it is looked up.
+    '''
+
+    def __init__(self, store):
+
+        header = POSTINGS.unpack_from(store.map, store.postings_offset)
+        self.count = header[0]
+        term_index, terms, list_index, lists = header[2:]
+
+        view = memoryview(store.map)
+        self.term_index = view[term_index:term_index + 8 * (self.count + 1)].cast('Q')
+        self.terms = view[terms:terms + self.term_index[self.count]]
+        self.list_index = view[list_index:list_index + 8 * (self.count + 1)].cast('Q')
+        self.lists = view[lists:lists + 4 * self.list_index[self.count]].cast('i')
+
+    def __len__(self):
+        return self.count
+
+    def term(self, i):
+        return bytes(self.terms[self.term_index[i]:self.term_index[i + 1]])
+
+    def find(self, term):
+
+        # The index of a term, or None
+        key = term.encode('utf-8')
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.term(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self.term(low) == key:
+            return low
+        return None
+
+    def docs(self, i):
+
+        # Decode the list of the term at index i
+        values = self.lists[self.list_index[i]:self.list_index[i + 1]]
+        docs = {}
+        j = 0
+        while j < len(values):
+            count = values[j + 1]
+            docs[values[j]] = values[j + 2:j + 2 + count].tolist()
+            j += 2 + count
+        return docs
+
+    def get(self, term, default=None):
+        i = self.find(term)
+        return self.docs(i) if i is not None else default
+
+    def items(self):
+
+        # Every (term, {section: [positions]}), decoded
+        for i in range(self.count):
+            yield (self.term(i).decode('utf-8'), self.docs(i))
+
+#####################################################################
+
+class SectionView():
+
+    '''
+    A read-only, Section-compatible view of one section in
+    a SectionStore. Strings are decoded only when accessed.
+    '''
+
+    __slots__ = ('store', 'index', 'number', 'keywords', 'related')
+
+    # Nothing is ever computed on a view
+    latency = {}
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+        self.number = store.number(index)
+        self.keywords = None # filled in from the metadata by Volume.load
+        self.related = None # this one too
+
+    @property
+    def text(self):
+        return self.store.text(self.index)
+
+    @property
+    def summary(self):
+        return self.store.summary(self.index)
+
+    @property
+    def keyword(self):
+        return self.store.keyword(self.index)
+
+    @property
+    def ranking(self):
+        return self.store.ranking(self.index)
+
+    def summary_of(self, length):
+        return self.ranking.select(sentences=length)
+
+    def sentence_count(self):
+        return self.store.sentence_count(self.index)
+
+    def computed(self):
+        return True
+
+    def keyword_set(self):
+        words = {self.keyword.lower()}
+        for word, score in self.keywords or []:
+            words.add(word.lower())
+        return words
+
+    def keyword_match(self, keyword):
+        return keyword.lower() in self.keyword_set()
+
+    def number_match(self, number):
+        return number == self.number
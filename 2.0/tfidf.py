@@ -0,0 +1,167 @@
+'''
+Defines the TfidfIndex class.
+
+A TfidfIndex object weighs every stemmed term of every
+section by TF-IDF over the whole collection:
+
+    - tf: how often the term occurs in the section, damped
+      as 1 + log(count) so one long list does not dominate
+    - idf: log((1 + sections) / (1 + sections containing it)) + 1,
+      so words found everywhere in the volume ("section",
+      "shall", "administration") count for little
+
+The weights are one sparse matrix (sections x terms) built
+in a single pass, with every row scaled to unit length.
+The best keywords of a section are simply the largest
+entries of its row, so the keywords of the whole volume
+come out of one batched computation instead of one
+co-occurrence graph per section.
+
+The dot product of two rows is the cosine similarity of
+two sections, so the most similar sections of every section
+come from the product of the matrix with its transpose.
+That product is computed a block of rows at a time, so at
+most MAX_PRODUCT similarities exist at once however many
+sections there are.
+'''
+
+###############################
+import numpy as np
+from scipy import sparse
+from textrank import RE_WORD, STOPWORDS, stem_word
+from metrics import timed
+###############################
+
+# The number of keywords kept for each section
+TOP_KEYWORDS = 5
+
+# The number of related sections kept for each section
+TOP_RELATED = 5
+
+# The most similarities held in memory at once (block rows x sections)
+MAX_PRODUCT = 2 ** 24
+
+#####################################################################
+
+def count_terms(texts):
+
+    '''
+    Count the stemmed terms of every text.
+    Returns (counts, terms, surface): a sparse matrix of
+    counts (texts x terms), the stem of each term id, and
+    for each term id the word form seen most often.
+    '''
+
+    vocabulary = {} # stem -> term id
+    forms = [] # term id -> {word: count}
+    rows = []
+    columns = []
+    for row, text in enumerate(texts):
+        for word in RE_WORD.findall(text.lower()):
+            if len(word) < 3 or word in STOPWORDS:
+                continue
+            stem = stem_word(word)
+            term = vocabulary.get(stem)
+            if term is None:
+                term = len(vocabulary)
+                vocabulary[stem] = term
+                forms.append({})
+            forms[term][word] = forms[term].get(word, 0) + 1
+            rows.append(row)
+            columns.append(term)
+
+    # Repeated (row, term) pairs are added up by the conversion
+    counts = sparse.coo_matrix((np.ones(len(rows)), (rows, columns)),
+                               shape=(len(texts), len(vocabulary))).tocsr()
+    terms = list(vocabulary)
+    surface = [max(words, key=words.get) for words in forms]
+    return counts, terms, surface
+
+#####################################################################
+
+def top_k(scores, ids, k):
+
+    '''
+    The positions of the k largest scores, best first,
+    ties broken by id. Only the k best are sorted.
+    '''
+
+    best = np.arange(len(scores))
+    if len(scores) > k:
+        best = np.argpartition(-scores, k)[:k]
+    return best[np.lexsort((ids[best], -scores[best]))]
+
+#####################################################################
+
+class TfidfIndex():
+
+    @timed('tfidf')
+    def __init__(self, texts):
+
+        counts, self.terms, self.surface = count_terms(texts)
+        n = counts.shape[0]
+
+        # The number of texts each term appears in
+        frequencies = np.bincount(counts.indices, minlength=len(self.terms))
+        self.idf = np.log((1 + n) / (1 + frequencies)) + 1
+
+        # Damped term frequency times idf, then unit-length rows
+        weights = counts.copy()
+        weights.data = 1 + np.log(weights.data)
+        weights = weights.multiply(self.idf).tocsr()
+        norms = np.sqrt(np.asarray(weights.multiply(weights).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        self.matrix = sparse.diags(1 / norms).dot(weights).tocsr()
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def keywords(self, k=TOP_KEYWORDS):
+
+        '''
+        Returns, for every text, a list of up to k
+        (keyword, score) pairs, best first.
+        '''
+
+        matrix = self.matrix
+        result = []
+        for row in range(matrix.shape[0]):
+            start, end = matrix.indptr[row], matrix.indptr[row + 1]
+            scores = matrix.data[start:end]
+            terms = matrix.indices[start:end]
+            best = top_k(scores, terms, k)
+            result.append([(self.surface[terms[i]], float(scores[i])) for i in best])
+        return result
+
+    @timed('related')
+    def related(self, k=TOP_RELATED):
+
+        '''
+        Returns, for every text, a list of up to k (row, similarity)
+        pairs for the most similar other texts, best first.
+        Texts that share no term are never related.
+        '''
+
+        matrix = self.matrix
+        n = matrix.shape[0]
+        transposed = matrix.T.tocsr()
+        block = max(1, MAX_PRODUCT // max(n, 1))
+
+        result = []
+        for first in range(0, n, block):
+            # Similarities of this block of rows with every row,
+            # as a sparse matrix: pairs sharing no term are absent
+            product = matrix[first:first + block].dot(transposed).tocsr()
+            for i in range(product.shape[0]):
+                start, end = product.indptr[i], product.indptr[i + 1]
+                scores = product.data[start:end]
+                rows = product.indices[start:end]
+
+                # A text is not related to itself
+                others = (rows != first + i) & (scores > 0)
+                scores = scores[others]
+                rows = rows[others]
+
+                best = top_k(scores, rows, k)
+                result.append([(int(rows[j]), float(scores[j])) for j in best])
+        return result
@@ -3,33 +3,192 @@ Defines the Document class.
 An object of the Document class has
 a list of Page objects.
 
-The constructor accepts a file name as an argument,
-opens the file,
-reads the file,
-extracts the text from each page,
-and creates the list of Page objects.
+The constructor accepts a file name as an argument
+and opens the file. Reading the PDF only goes as far
+as its cross-reference table: the text of a page is
+extracted, preprocessed and summarized the first time
+that page is accessed, e.g. document.pages[12].
+
+The most recently used pages are kept in memory, up to
+a budget in bytes, and older pages are dropped and
+extracted again if they are needed later.
+
+When every page is needed (bulk export, pre-warming),
+iter_pages splits the page range into contiguous chunks
+and hands them to a pool of worker processes, each of
+which opens the PDF on its own.
 '''
 
 ###############################
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 import PyPDF2
-from Page import Page
+from Page import Page, extract_text
+from metrics import timer, watch_cache
 ###############################
 
+class PageCache():
+
+    '''
+    A list-like sequence of Page objects that are
+    created on first access and kept in an LRU cache.
+    '''
+
+    def __init__(self, reader, count, max_bytes):
+
+        self.reader = reader
+        self.count = count
+        self.max_bytes = max_bytes
+        self.pages = OrderedDict() # page number -> Page, oldest first
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+        # PyPDF2 readers are not safe to share between threads, so
+        # extraction holds reader_lock. Preprocessing and summarizing
+        # run outside of it, and lock only guards the cached pages.
+        self.reader_lock = threading.Lock()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def stats(self):
+
+        # The counters, as a dictionary
+        with self.lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'pages': len(self.pages),
+                    'bytes': self.size}
+
+    def __iter__(self):
+        for pg in range(self.count):
+            yield self[pg]
+
+    def __getitem__(self, pg):
+
+        # Slices return a list of pages
+        if isinstance(pg, slice):
+            return [self[i] for i in range(*pg.indices(self.count))]
+
+        if pg < 0:
+            pg += self.count
+        if pg < 0 or pg >= self.count:
+            raise IndexError('page index out of range')
+
+        with self.lock:
+            page = self.pages.get(pg)
+            if page is not None:
+                self.pages.move_to_end(pg)
+                self.hits += 1
+                return page
+
+            self.misses += 1
+
+        with self.reader_lock:
+            text = extract_text(self.reader, pg)
+        page = Page(self.reader, pg, text)
+
+        # Another thread may have added the same page meanwhile
+        with self.lock:
+            if pg in self.pages:
+                self.pages.move_to_end(pg)
+                return self.pages[pg]
+            self.add(pg, page)
+            return page
+
+    def add(self, pg, page):
+
+        # Keep a page and drop the oldest ones beyond the budget
+        self.pages[pg] = page
+        self.size += page_size(page)
+        while self.size > self.max_bytes and len(self.pages) > 1:
+            oldest_pg, oldest = self.pages.popitem(last=False)
+            self.size -= page_size(oldest)
+
+#####################################################################
+
+def page_size(page):
+
+    # A rough size in bytes of what a Page keeps in memory
+    ranked = sum(len(sentence) for sentence in page.ranking.sentences)
+    return len(page.text) + len(page.summary) + len(page.keywords) + ranked
+
+#####################################################################
+
+def read_pages(filename, start, stop):
+
+    '''
+    Open the PDF and return the Page objects from start
+    up to (not including) stop. This is the unit of work
+    of each worker process in Document.iter_pages.
+    '''
+
+    with open(filename, 'rb') as docfile:
+        document = PyPDF2.PdfFileReader(docfile)
+        return [Page(document, pg) for pg in range(start, stop)]
+
+#####################################################################
+
 class Document():
 
-    def __init__(self, filename):
+    def __init__(self, filename, max_bytes=16 * 1024 * 1024):
+
+        self.filename = filename
 
-        # Open the PDF file
-        docfile = open(filename, 'rb')
+        # Open the PDF file (it stays open while pages are read)
+        self.docfile = open(filename, 'rb')
 
         # Read the file object
-        document = PyPDF2.PdfFileReader(docfile)
+        with timer('pdf_open'):
+            document = PyPDF2.PdfFileReader(self.docfile)
+            count = document.getNumPages()
+
+        # A list-like object of Page objects, each one
+        # extracted and summarized on first access
+        self.pages = PageCache(document, count, max_bytes)
+
+        # Report its hit rate with the other metrics
+        watch_cache('page', self.pages)
+
+    def close(self):
+        self.docfile.close()
+
+    def iter_pages(self, workers=4, start=0, stop=None, progress=None):
+
+        '''
+        A generator of every Page from start to stop, in order,
+        computed by a pool of worker processes.
+
+        The range is split into contiguous chunks, two per
+        worker. Pages are yielded as soon as their chunk (and
+        every chunk before it) is done. progress, if given,
+        is called with (done, total) after each chunk.
+        '''
+
+        if stop is None:
+            stop = len(self.pages)
+        total = max(stop - start, 0)
+        if total == 0:
+            return
+
+        # Each chunk reopens the PDF, so keep them few but big
+        chunk = max(1, -(-total // (workers * 2))) # ceiling division
+        ranges = [(first, min(first + chunk, stop)) for first in range(start, stop, chunk)]
 
-        # Make a list of Page objects
-        pageList = []
-        for pg in range(document.getNumPages()):
-            pageList.append(Page(document, pg))
-        self.pages = pageList
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(read_pages, self.filename, first, last)
+                       for first, last in ranges]
+            done = 0
+            for future in futures:
+                pages = future.result()
+                done += len(pages)
+                if progress is not None:
+                    progress(done, total)
+                for page in pages:
+                    yield page
 
     def get_summary(self):
 
@@ -38,4 +197,4 @@ class Document():
 
         # Print out the original text and the summary
         print("Original Text:\n" + self.pages[pg+1].text)
-        print("\nSummary:\n" + self.pages[pg+1].summary)
\ No newline at end of file
+        print("\nSummary:\n" + self.pages[pg+1].summary)
@@ -4,40 +4,68 @@ An object of the Page class has
 the text of a page,
 the summary of the text,
 and the keywords.
+
+The sentences are ranked once, when the Page is created,
+so changing the length of the summary is instant.
 '''
 
 #####################################################
-from gensim.summarization import summarize, keywords
+from textrank import analyze, rank, keywords_analysis
+from metrics import timed, timer
 import re
 #####################################################
 
+# The fraction of the sentences in a summary, unless a length is asked for
+SUMMARY_RATIO = 0.05
+
+def extract_text(document, pageNum):
+
+    # Take a page out of the document and extract its text
+    with timer('pdf_extract'):
+        return document.getPage(pageNum).extractText()
+
 class Page():
 
-    def __init__(self, document, pageNum):
-        
-         # Take a page out of the document:
-        page = document.getPage(pageNum)
+    def __init__(self, document, pageNum, text=None):
 
-        # Extract text
-        text = page.extractText()
+        # Extract text (unless the caller already did,
+        # as the PageCache does while holding its reader lock)
+        if text is None:
+            text = extract_text(document, pageNum)
 
         # Preprocess text
         text = self.preprocess(text)
         
         self.text = text
-        self.summary = self.summarize(0.05)
-        self.keywords = keywords(text, ratio=0.02)
+
+        # Read the text once, for both the ranking and the keywords
+        analysis = analyze(text)
+        self.ranking = rank(analysis)
+        self.summary = self.summarize(SUMMARY_RATIO)
+        self.keywords = keywords_analysis(analysis, ratio=0.02)
 
     # Add functionality for changing ratio
     def change_ratio(self, ratio):
         self.summary = self.summarize(ratio)
 
+    # Or the number of sentences, or of words
+    def change_length(self, sentences=None, words=None):
+        if sentences is None and words is None:
+            raise ValueError('change_length needs a number of sentences or of words')
+        self.summary = self.summarize(sentences=sentences, words=words)
+
     # Capitalize the first letter in the sentence
-    def summarize(self, ratio):
-        try:
-            summary = summarize(self.text, ratio=ratio)
-        except ValueError:
+    def summarize(self, ratio=None, sentences=None, words=None):
+
+        # Without any length, the usual fraction of the page
+        if ratio is None and sentences is None and words is None:
+            ratio = SUMMARY_RATIO
+
+        # A page with a single sentence is its own summary
+        if len(self.ranking.sentences) < 2:
             summary = self.text
+        else:
+            summary = self.ranking.select(ratio=ratio, sentences=sentences, words=words)
         if len(summary) > 1:
             summary = summary[0].upper() + summary[1:]
         #summary = summary[0].upper() + summary[1:]
@@ -47,6 +75,7 @@ class Page():
     def match(self, word):
         return word in self.keywords
 
+    @timed('pdf_preprocess')
     def preprocess(self, text):
 
         # Remove the first line
@@ -0,0 +1,235 @@
+'''
+RegSum benchmark suite.
+
+Times every stage of the RegSum pipeline on the bundled data:
+
+    - XML path (2.0/): clean_xml, preprocess, Volume construction,
+      get_summary and get_keyword on every section, the TF-IDF
+      keywords of the whole volume, and
+      search_by_number / search_by_keyword
+    - PDF path: Document and Page construction on
+      flask_2-19_11-23/CFR-2019-title13-vol1.pdf
+    - end to end: /summary latency through the Flask test client
+
+Usage:
+
+    python bench.py                                  # run, write bench_results.json
+    python bench.py -o baseline.json                 # save a baseline
+    python bench.py --baseline baseline.json         # compare against it
+
+In comparison mode every benchmark is printed with its change
+against the baseline, and the exit status is 1 if any of them
+got slower by more than --threshold (10% by default).
+'''
+
+###############################
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+###############################
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+XML_DIR = os.path.join(ROOT, '2.0')
+XML_FILE = os.path.join(XML_DIR, 'CFR_Title13_Volume1.xml')
+PDF_FILE = os.path.join(ROOT, 'flask_2-19_11-23', 'CFR-2019-title13-vol1.pdf')
+
+# Rounds of lookups per search benchmark run
+LOOKUPS = 1000
+
+# The XML path lives in 2.0/, the PDF path at the top level
+sys.path.insert(0, ROOT)
+sys.path.insert(0, XML_DIR)
+
+#####################################################################
+
+@contextlib.contextmanager
+def quiet():
+
+    # Throw away anything printed (RegSum reports its progress)
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            yield
+
+def measure(function, repeat):
+
+    '''
+    Run function repeat times and return the times in seconds.
+    Anything it prints is thrown away.
+    '''
+
+    times = []
+    with quiet():
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+    return times
+
+def summarize_times(times):
+
+    # The numbers kept for each benchmark
+    return {'runs': len(times),
+            'min': min(times),
+            'median': statistics.median(times),
+            'mean': statistics.mean(times)}
+
+#####################################################################
+
+def bench_xml(results, repeat):
+
+    from functions import Volume, clean_xml, preprocess, get_summary, get_keyword, get_keywords
+
+    # clean_xml writes a new file, so each run gets a fresh name
+    with tempfile.TemporaryDirectory() as scratch:
+        runs = iter(range(repeat))
+        results['clean_xml'] = measure(
+            lambda: clean_xml(XML_FILE, os.path.join(scratch, 'clean%d.xml' % next(runs))), repeat)
+
+    # Volume construction only parses the XML...
+    results['volume_parse'] = measure(lambda: Volume(XML_FILE), repeat)
+
+    # ...and these do the NLP for every section
+    volume = Volume(XML_FILE)
+    texts = [section.text for section in volume.sections]
+    results['preprocess_all'] = measure(lambda: [preprocess(text) for text in texts], repeat)
+    results['get_summary_all'] = measure(lambda: [get_summary(text) for text in texts], repeat)
+    results['get_keyword_all'] = measure(lambda: [get_keyword(text) for text in texts], repeat)
+    results['get_keywords_tfidf'] = measure(lambda: get_keywords(texts), repeat)
+    results['volume_build'] = measure(lambda: Volume(XML_FILE).warm(), repeat)
+
+    # Lookups, on a Volume whose keywords are all known.
+    # A single lookup is too fast to time, so each run does
+    # LOOKUPS rounds over every section.
+    with quiet():
+        volume.warm()
+        volume.search_by_keyword('')
+    numbers = [section.number for section in volume.sections]
+    keywords = [section.keyword for section in volume.sections]
+    results['search_by_number'] = measure(
+        lambda: [volume.search_by_number(number) for _ in range(LOOKUPS) for number in numbers], repeat)
+    results['search_by_keyword'] = measure(
+        lambda: [volume.search_by_keyword(keyword) for _ in range(LOOKUPS) for keyword in keywords], repeat)
+
+def bench_pdf(results, repeat, pages):
+
+    import PyPDF2
+    from Document import Document
+    from Page import Page
+
+    results['document_open'] = measure(lambda: Document(PDF_FILE), repeat)
+
+    with open(PDF_FILE, 'rb') as docfile:
+        reader = PyPDF2.PdfFileReader(docfile)
+        first = min(40, reader.getNumPages() - pages)
+        results['page_construct'] = measure(
+            lambda: [Page(reader, pg) for pg in range(first, first + pages)], repeat)
+
+def bench_flask(results, repeat):
+
+    # app.py opens its files relative to its own folder.
+    # Wait for its background warm-up, so it does not
+    # compete with the requests being timed.
+    os.chdir(XML_DIR)
+    with quiet():
+        import app
+        while app.status['stage'] not in ('ready', 'failed'):
+            time.sleep(0.01)
+    client = app.app.test_client()
+    numbers = list(app.numbers)
+
+    # Cold: the rendered-page cache is emptied before every run
+    def cold():
+        app.summary_pages.clear()
+        for number in numbers:
+            client.post('/summary', data={'sectno': number})
+    results['flask_summary_cold'] = measure(cold, repeat)
+
+    # Warm: every page is already rendered
+    results['flask_summary_warm'] = measure(
+        lambda: [client.get('/summary', query_string={'sectno': number}) for number in numbers], repeat)
+
+#####################################################################
+
+def compare(results, baseline, threshold):
+
+    '''
+    Print each benchmark next to its baseline.
+    Returns the names of the benchmarks that got slower
+    by more than threshold (a fraction, e.g. 0.1).
+    '''
+
+    regressions = []
+    print('%-22s %12s %12s %9s' % ('benchmark', 'baseline', 'now', 'change'))
+    for name, now in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print('%-22s %12s %11.4fs %9s' % (name, '-', now['median'], 'new'))
+            continue
+        change = now['median'] / before['median'] - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  SLOWER'
+        print('%-22s %11.4fs %11.4fs %+8.1f%%%s'
+              % (name, before['median'], now['median'], 100 * change, flag))
+    return regressions
+
+def main():
+
+    parser = argparse.ArgumentParser(description='RegSum benchmark suite')
+    parser.add_argument('-o', '--output', default='bench_results.json',
+                        help='where to write the results (JSON)')
+    parser.add_argument('-n', '--repeat', type=int, default=3,
+                        help='runs per benchmark (the median is compared)')
+    parser.add_argument('--pages', type=int, default=20,
+                        help='number of PDF pages to construct')
+    parser.add_argument('--baseline', default=None,
+                        help='results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='slowdown that counts as a regression (default 0.10)')
+    parser.add_argument('--only', choices=['xml', 'pdf', 'flask'], action='append',
+                        help='run only these groups (may be repeated)')
+    args = parser.parse_args()
+
+    groups = args.only or ['xml', 'pdf', 'flask']
+    output = os.path.abspath(args.output)
+
+    times = {}
+    if 'xml' in groups:
+        bench_xml(times, args.repeat)
+    if 'pdf' in groups:
+        bench_pdf(times, args.repeat, args.pages)
+    if 'flask' in groups:
+        bench_flask(times, args.repeat)
+
+    results = {name: summarize_times(run_times) for name, run_times in times.items()}
+    report = {'python': platform.python_version(),
+              'machine': platform.machine(),
+              'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'repeat': args.repeat,
+              'results': results}
+
+    with open(output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        regressions = compare(results, baseline, args.threshold)
+        print('Wrote %s' % output)
+        if regressions:
+            print('Regressions: %s' % ', '.join(regressions))
+            sys.exit(1)
+    else:
+        for name, result in results.items():
+            print('%-22s %11.4fs' % (name, result['median']))
+        print('Wrote %s' % output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+'''
+Lightweight timing instrumentation.
+
+Stages of the pipeline are timed with the timed decorator
+or the timer context manager:
+
+    @timed('preprocess')
+    def preprocess(text): ...
+
+    with timer('xml_parse'):
+        ...
+
+Every stage gets a histogram of its durations. Things that
+only ever grow are counted with count (after describing them
+once), and values read at scrape time are registered with
+gauge:
+
+    describe('regsum_single_flight_computed_total', 'Computations started', 'flight')
+    count('regsum_single_flight_computed_total', 'sections')
+
+render writes all histograms, counters and gauges in the
+Prometheus text format for a /metrics endpoint.
+
+Set the environment variable REGSUM_METRICS=0 (or set
+metrics.ENABLED = False) to turn the timers and counters off.
+A disabled timer or counter only checks one flag, so it costs
+next to nothing.
+'''
+
+###############################
+import functools
+import os
+import threading
+import time
+###############################
+
+ENABLED = os.environ.get('REGSUM_METRICS', '1') != '0'
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+lock = threading.Lock()
+
+# (metric name, label value) -> Histogram
+histograms = {}
+
+# metric name -> (help text, label name)
+families = {}
+
+# (metric name, label value) -> count
+counters = {}
+
+# metric name -> (help text, label name, function returning {label value: number})
+gauges = {}
+
+#####################################################################
+
+class Histogram():
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+#####################################################################
+
+def describe(name, help_text, label):
+
+    # Register the help text and label name of a histogram or counter
+    families[name] = (help_text, label)
+
+describe('regsum_stage_seconds', 'Time spent in each stage of the pipeline', 'stage')
+describe('regsum_request_seconds', 'Time spent answering each HTTP endpoint', 'endpoint')
+
+def observe(name, label, seconds):
+
+    # Add one duration to a histogram
+    with lock:
+        histogram = histograms.get((name, label))
+        if histogram is None:
+            histogram = histograms[(name, label)] = Histogram()
+        histogram.observe(seconds)
+
+def count(name, label, amount=1):
+
+    # Add to a counter
+    if not ENABLED:
+        return
+    with lock:
+        counters[(name, label)] = counters.get((name, label), 0) + amount
+
+def gauge(name, help_text, label, function):
+
+    '''
+    Register a gauge: function is called at every scrape and
+    returns a dictionary of label value -> number.
+    '''
+
+    gauges[name] = (help_text, label, function)
+
+def watch_cache(name, cache):
+
+    '''
+    Report the counters of a cache (anything with a stats
+    method returning hits and misses) and its hit rate.
+    '''
+
+    def read():
+        stats = dict(cache.stats())
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    gauge('regsum_%s_cache' % name, 'Counters and hit rate of the %s cache' % name, 'counter', read)
+
+#####################################################################
+
+class Timer():
+
+    # Times one run of a stage
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe('regsum_stage_seconds', self.stage, time.perf_counter() - self.start)
+        return False
+
+class NullTimer():
+
+    # What timer returns when instrumentation is off
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_TIMER = NullTimer()
+
+def timer(stage):
+
+    # A context manager that times the block inside it
+    if not ENABLED:
+        return NULL_TIMER
+    return Timer(stage)
+
+def timed(stage):
+
+    # A decorator that times every call of a function
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                observe('regsum_stage_seconds', stage, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+#####################################################################
+
+def format_value(value):
+
+    # Prometheus spells infinity +Inf
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render():
+
+    '''
+    Returns every metric in the Prometheus text format.
+    '''
+
+    lines = []
+    with lock:
+        histogram_items = sorted(histograms.items())
+        counter_items = sorted(counters.items())
+
+    # Histograms, grouped by name
+    written = set()
+    for (name, label), histogram in histogram_items:
+        help_text, label_name = families.get(name, (name, 'label'))
+        if name not in written:
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s histogram' % name)
+            written.add(name)
+        cumulative = 0
+        for bound, bucket in zip(BUCKETS, histogram.buckets):
+            cumulative += bucket
+            lines.append('%s_bucket{%s="%s",le="%s"} %d'
+                         % (name, label_name, label, format_value(bound), cumulative))
+        lines.append('%s_sum{%s="%s"} %s' % (name, label_name, label, format_value(histogram.sum)))
+        lines.append('%s_count{%s="%s"} %d' % (name, label_name, label, histogram.count))
+
+    # Counters
+    for (name, label), value in counter_items:
+        help_text, label_name = families.get(name, (name, 'label'))
+        if name not in written:
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s counter' % name)
+            written.add(name)
+        lines.append('%s{%s="%s"} %s' % (name, label_name, label, format_value(value)))
+
+    # Gauges, read right now
+    for name, (help_text, label_name, function) in sorted(gauges.items()):
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s gauge' % name)
+        for label, value in sorted(function().items()):
+            lines.append('%s{%s="%s"} %s' % (name, label_name, label, format_value(value)))
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,138 @@
+'''
+Defines the SentenceSplitter class.
+
+A SentenceSplitter cuts text into sentences. It is tuned for
+the Code of Federal Regulations, where a period is very often
+not the end of a sentence:
+
+    - abbreviations: "15 U.S.C. 636(a)", "e.g.", "i.e.",
+      "Sec. 7(a)", "Pub. L. 85-536", "No. 3245-0016"
+    - initials: "John Q. Public"
+    - section references: "§ 120.10", "§§ 121.101 through 121.108"
+
+A sentence ends at . ! or ? followed by whitespace (or at a
+newline), unless the word before the period is a known
+abbreviation or a single initial, or the next word starts
+with a lowercase letter or a digit in a text that is not
+all lowercase. A period inside a number ("120.10") is never
+followed by whitespace, so it is never an end.
+
+Everything is compiled once, when the module is imported,
+and the shared splitter object is used for every text:
+there is no per-call loading. split_batch segments a whole
+list of sections in one call.
+'''
+
+###############################
+import re
+###############################
+
+# Time the splitting where the metrics module is around
+# (2-23 has none, and then nothing is timed)
+try:
+    from metrics import timed
+except ImportError:
+    def timed(stage):
+        return lambda function: function
+
+# Words that end with a period without ending the sentence
+# (lowercase, without the final period)
+ABBREVIATIONS = frozenset('''
+    u.s.c u.s c.f.r fed reg pub l stat e.g i.e et al seq
+    cf viz para art ch subch app approx dept admin inc
+    corp co ltd llc jr sr mr mrs ms dr st ave jan feb mar apr jun jul aug
+    sep sept oct nov dec
+'''.split())
+
+# Abbreviations that are only abbreviations before a number,
+# as in "No. 3245-0016" or "Sec. 7(a)" (but not "... say no. Then")
+NUMBER_ABBREVIATIONS = frozenset('no nos sec secs par pars pt pts vol'.split())
+
+# A candidate end: one or more of . ! ? and any closing quotes
+# or brackets, followed by whitespace
+RE_END = re.compile(r'[.!?]+["\')\]”’]*(?=\s)')
+
+# The first character after a candidate end
+RE_NEXT = re.compile(r'\s*(\S)')
+
+# A single initial, like the "Q." in "John Q. Public"
+RE_INITIAL = re.compile(r'^[A-Za-z]\.$')
+
+#####################################################################
+
+class SentenceSplitter():
+
+    def __init__(self, abbreviations=ABBREVIATIONS, number_abbreviations=NUMBER_ABBREVIATIONS):
+        self.abbreviations = abbreviations
+        self.number_abbreviations = number_abbreviations
+
+    def split(self, text):
+
+        # Return the list of sentences in the text
+        sentences = []
+        for line in text.split('\n'):
+            sentences.extend(self.split_line(line))
+        return sentences
+
+    def split_batch(self, texts):
+
+        # Return the list of sentences of every text
+        return [self.split(text) for text in texts]
+
+    def split_line(self, line):
+
+        # Next-word casing only means something in mixed-case text
+        mixed_case = line != line.lower()
+
+        sentences = []
+        start = 0
+        for match in RE_END.finditer(line):
+            if self.is_end(line, start, match, mixed_case):
+                sentence = line[start:match.end()].strip()
+                if sentence:
+                    sentences.append(sentence)
+                start = match.end()
+
+        # Whatever is left is a sentence too (a heading, say)
+        rest = line[start:].strip()
+        if rest:
+            sentences.append(rest)
+        return sentences
+
+    def is_end(self, line, start, match, mixed_case):
+
+        following = RE_NEXT.match(line, match.end())
+        following = following.group(1) if following else ''
+
+        # Only a period can belong to an abbreviation or initial
+        if line[match.start()] == '.':
+            space = max(line.rfind(' ', start, match.start()),
+                        line.rfind('\t', start, match.start()), start - 1)
+            word = line[space + 1:match.start() + 1].lstrip('(["\'“‘')
+            abbreviation = word[:-1].lower()
+            if abbreviation in self.abbreviations or RE_INITIAL.match(word):
+                return False
+            if abbreviation in self.number_abbreviations and (following.isdigit() or following == '('):
+                return False
+
+        # "... as in § 121.101. and ..." is not a new sentence
+        if mixed_case and (following.islower() or following.isdigit() or following == '§'):
+            return False
+        return True
+
+#####################################################################
+
+# The one splitter of this process
+splitter = SentenceSplitter()
+
+@timed('sentence_split')
+def split_sentences(text):
+
+    # Return the list of sentences in the text
+    return splitter.split(text)
+
+@timed('sentence_split')
+def split_batch(texts):
+
+    # Return the list of sentences of every text
+    return splitter.split_batch(texts)
@@ -0,0 +1,483 @@
+'''
+A built-in TextRank summarizer.
+
+This replaces gensim.summarization.summarize, which was
+removed in gensim 4 and scores sentences with pure-Python
+loops over every pair of sentences. The algorithm is the
+same one described at the top of functions.py:
+
+    1. Split the text into sentences (with the legal-text
+       SentenceSplitter of sentences.py), then remove stop
+       words and stem the remaining words.
+    2. Score every pair of sentences with Okapi BM25.
+       Here this is one sparse matrix product instead
+       of a loop over pairs.
+    3. Run PageRank over the weighted sentence graph,
+       as a power iteration that stops once the scores
+       change by less than a tolerance.
+    4. Pick the sentences with the highest score and
+       return them in their original order.
+
+Keywords are found the same way gensim finds them: words
+that appear next to each other are linked in a graph, and
+PageRank picks the most central words.
+
+Both start from an Analysis of the text, which splits,
+tokenizes and stems it exactly once. Callers that need both
+a summary and keywords should analyze the text themselves
+and pass the Analysis to summarize_analysis and
+keywords_analysis.
+
+summarize and keywords take the same arguments as the gensim
+functions, so they can be imported in their place.
+
+Running this file benchmarks it against gensim (when gensim
+is installed) on the sections of the bundled Title 13 volume.
+'''
+
+###############################
+import re
+import numpy as np
+from scipy import sparse
+from nltk.stem.porter import PorterStemmer
+from metrics import timed
+from sentences import split_sentences, split_batch
+###############################
+
+# Okapi BM25 parameters (the same values gensim uses)
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_EPSILON = 0.25
+
+# PageRank parameters
+DAMPING = 0.85
+TOLERANCE = 1e-6
+MAX_ITERATIONS = 100
+
+# Long-document mode: texts with more sentences than LONG_DOCUMENT
+# are ranked in chunks of about CHUNK_SENTENCES sentences, and the
+# CHUNK_WINNERS best sentences of every chunk are ranked again together
+LONG_DOCUMENT = 1000
+CHUNK_SENTENCES = 200
+CHUNK_WINNERS = 40
+
+# Common English words that say nothing about a sentence
+STOPWORDS = frozenset('''
+    a about above after again against all also am an and any are as at be
+    because been before being below between both but by can could did do
+    does doing done down during each either else etc ever every few for
+    from further had has have having he her here hers herself him himself
+    his how however i if in into is it its itself just least less let like
+    made make many may me might more most much must my myself neither no
+    nor not now of off often on once only or other otherwise our ours
+    ourselves out over own per rather same say says shall she should since
+    so some such than that the their theirs them themselves then there
+    thereby therefore these they this those though through thus to too
+    under until up upon us very via was we were what whatever when where
+    whereas whether which while who whom whose why will with within without
+    would yet you your yours yourself yourselves
+'''.split())
+
+RE_WORD = re.compile(r'[a-z]+')
+
+stemmer = PorterStemmer()
+stem_cache = {}
+
+#####################################################################
+
+def stem_word(word):
+
+    # Porter stem of a lowercase word, remembered for next time
+    stem = stem_cache.get(word)
+    if stem is None:
+        stem = stemmer.stem(word)
+        stem_cache[word] = stem
+    return stem
+
+#####################################################################
+
+class Analysis():
+
+    '''
+    The result of reading a text once:
+        - sentences: the list of sentences
+        - term_ids: for each sentence, the ids of its stemmed terms
+        - terms: the stem of each term id
+        - frequencies: how often each term id occurs in the text
+        - surface: for each term id, the word form seen most often
+    '''
+
+    def __init__(self, text, sentences=None):
+
+        # The sentences may already be known (see split_batch)
+        if sentences is None:
+            sentences = split_sentences(text)
+        self.sentences = sentences
+
+        vocabulary = {} # stem -> term id
+        forms = [] # term id -> {word: count}
+        self.term_ids = []
+        for sentence in self.sentences:
+            ids = []
+            for word in RE_WORD.findall(sentence.lower()):
+                if len(word) < 3 or word in STOPWORDS:
+                    continue
+                stem = stem_word(word)
+                term = vocabulary.get(stem)
+                if term is None:
+                    term = len(vocabulary)
+                    vocabulary[stem] = term
+                    forms.append({})
+                forms[term][word] = forms[term].get(word, 0) + 1
+                ids.append(term)
+            self.term_ids.append(ids)
+
+        self.terms = list(vocabulary)
+        self.surface = [max(counts, key=counts.get) for counts in forms]
+        all_ids = [term for ids in self.term_ids for term in ids]
+        self.frequencies = np.bincount(np.array(all_ids, dtype=np.intp),
+                                       minlength=len(self.terms))
+
+#####################################################################
+
+@timed('analyze')
+def analyze(text, sentences=None):
+
+    # Split, tokenize and stem the text once
+    return Analysis(text, sentences)
+
+#####################################################################
+
+def bm25_matrix(term_ids, n_terms):
+
+    '''
+    Build the BM25 similarity matrix for a list of sentences,
+    each given as a list of term ids below n_terms.
+    Entry [i, j] scores sentence i as a query against
+    sentence j as a document.
+
+    Returns a scipy sparse matrix.
+    '''
+
+    rows = []
+    cols = []
+    for row, ids in enumerate(term_ids):
+        rows.extend([row] * len(ids))
+        cols.extend(ids)
+
+    n = len(term_ids)
+    counts = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                               shape=(n, n_terms))
+    counts.sum_duplicates()
+
+    # Inverse document frequency of each term.
+    # Terms in more than half the sentences would get a negative
+    # idf, so they get a small fraction of the average instead.
+    df = np.bincount(counts.indices, minlength=n_terms)
+    idf = np.log(n - df + 0.5) - np.log(df + 0.5)
+    idf[idf < 0] = BM25_EPSILON * idf.mean()
+
+    # Term weight of every (sentence, term) pair
+    lengths = np.asarray(counts.sum(axis=1)).ravel()
+    avgdl = lengths.mean()
+    tf = counts.data
+    row_of = np.repeat(np.arange(n), np.diff(counts.indptr))
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[row_of] / avgdl)
+    weights = counts.copy()
+    weights.data = idf[counts.indices] * tf * (BM25_K1 + 1) / (tf + norm)
+
+    # Every query term counts once per occurrence
+    return counts @ weights.T
+
+#####################################################################
+
+def pagerank(graph):
+
+    '''
+    Weighted PageRank by power iteration.
+    graph is a symmetric sparse matrix of edge weights.
+    Returns a numpy array with one score per node.
+    '''
+
+    n = graph.shape[0]
+
+    # Turn each row into transition probabilities
+    out_weight = np.asarray(graph.sum(axis=1)).ravel()
+    out_weight[out_weight == 0] = 1
+    transition = sparse.diags(1 / out_weight) @ graph
+    transition = transition.T.tocsr()
+
+    scores = np.full(n, 1 / n)
+    for _ in range(MAX_ITERATIONS):
+        new_scores = (1 - DAMPING) / n + DAMPING * (transition @ scores)
+        if np.abs(new_scores - scores).sum() < TOLERANCE:
+            return new_scores
+        scores = new_scores
+    return scores
+
+#####################################################################
+
+def graph_scores(term_ids, n_terms):
+
+    '''
+    Score sentences, given as lists of term ids below n_terms,
+    with TextRank. Sentences that share no terms with any other
+    sentence are not connected to the graph and score None.
+    '''
+
+    # Sentences made only of stop words take no part
+    kept = [i for i, ids in enumerate(term_ids) if ids]
+    scores = [None] * len(term_ids)
+    if len(kept) < 2:
+        return scores
+
+    similarity = bm25_matrix([term_ids[i] for i in kept], n_terms)
+
+    # One undirected edge per pair, weighted by the BM25 score
+    # of the earlier sentence against the later one
+    upper = sparse.triu(similarity, k=1).tocsr()
+    upper.eliminate_zeros()
+    graph = (upper + upper.T).tocsr()
+
+    connected = np.diff(graph.indptr) > 0
+    ranks = pagerank(graph)
+    for position, i in enumerate(kept):
+        if connected[position]:
+            scores[i] = float(ranks[position])
+    return scores
+
+#####################################################################
+
+def summarize(text, ratio=0.2, word_count=None, split=False):
+
+    '''
+    Drop-in replacement for gensim.summarization.summarize.
+
+    Returns the most important sentences of the text, in their
+    original order: ratio of the sentences, or as many as fit
+    in word_count words. Returns a list when split is True and
+    a newline-separated string otherwise.
+    '''
+
+    return summarize_analysis(analyze(text), ratio, word_count, split)
+
+#####################################################################
+
+def summarize_analysis(analysis, ratio=0.2, word_count=None, split=False):
+
+    # summarize, for a text that has already been analyzed
+    if len(analysis.sentences) == 1:
+        raise ValueError('input must have more than one sentence')
+
+    return rank(analysis).select(ratio=ratio, words=word_count, split=split)
+
+#####################################################################
+
+class Ranking():
+
+    '''
+    The sentences of a text, and their order from most to
+    least important. Once a text is ranked, a summary of any
+    length is just the first few sentences of the ranking,
+    so changing the length never runs TextRank again.
+    '''
+
+    def __init__(self, sentences, order):
+
+        # sentences: the sentences in their original order
+        self.sentences = sentences
+
+        # order: sentence indexes, best first
+        self.order = order
+
+    def select(self, ratio=None, sentences=None, words=None, split=False):
+
+        '''
+        Returns the best sentences in their original order:
+            - sentences: this many sentences
+            - words: as many as come closest to this many words
+            - ratio: this fraction of the sentences
+        Returns a list when split is True and a newline-separated
+        string otherwise.
+        '''
+
+        chosen = []
+        if sentences is not None:
+            chosen = self.order[:max(sentences, 0)]
+        elif words is not None:
+            count = 0
+            for i in self.order:
+                length = len(self.sentences[i].split())
+                # Stop when adding the sentence would move us
+                # further away from the word count
+                if abs(words - count - length) > abs(words - count):
+                    break
+                chosen.append(i)
+                count += length
+        else:
+            chosen = self.order[:int(len(self.sentences) * ratio)]
+
+        summary = [self.sentences[i] for i in sorted(chosen)]
+        return summary if split else '\n'.join(summary)
+
+#####################################################################
+
+@timed('textrank')
+def rank(analysis, long_document=LONG_DOCUMENT):
+
+    '''
+    Rank every sentence of an Analysis with TextRank.
+    Sentences that are not connected to the graph come
+    last, in their original order.
+
+    Comparing every pair of sentences costs time and memory
+    quadratic in their number, so a text with more than
+    long_document sentences is ranked hierarchically:
+
+        1. Cut it into chunks of about CHUNK_SENTENCES
+           consecutive sentences and rank each chunk.
+        2. Rank the CHUNK_WINNERS best sentences of every
+           chunk together (in chunks again, if there are
+           still too many). They come first.
+        3. The other sentences follow, ordered by their score
+           relative to the average score of their chunk.
+
+    The cost is then close to linear in the number of sentences.
+    '''
+
+    indexes = list(range(len(analysis.sentences)))
+    order = rank_indexes(indexes, analysis.term_ids, len(analysis.terms), long_document)
+    return Ranking(analysis.sentences, order)
+
+def rank_indexes(indexes, term_ids, n_terms, long_document):
+
+    # The sentences at the given indexes, best first
+    if len(indexes) <= long_document:
+        return exact_indexes(indexes, term_ids, n_terms)
+
+    # Chunks of (nearly) equal size, none of them tiny
+    chunks = -(-len(indexes) // CHUNK_SENTENCES) # ceiling division
+    size = -(-len(indexes) // chunks)
+
+    winners = []
+    others = [] # (score times chunk size, index); 1 is an average sentence
+    unscored = []
+    for start in range(0, len(indexes), size):
+        chunk = indexes[start:start + size]
+        scores = graph_scores([term_ids[i] for i in chunk], n_terms)
+        scored = [p for p in range(len(chunk)) if scores[p] is not None]
+        scored.sort(key=lambda p: scores[p], reverse=True)
+        winners.extend(chunk[p] for p in scored[:CHUNK_WINNERS])
+        others.extend((scores[p] * len(chunk), chunk[p]) for p in scored[CHUNK_WINNERS:])
+        unscored.extend(chunk[p] for p in range(len(chunk)) if scores[p] is None)
+
+    # With long_document below CHUNK_WINNERS every sentence can be
+    # a winner, and ranking the winners again would never end
+    if len(winners) >= len(indexes):
+        return exact_indexes(indexes, term_ids, n_terms)
+
+    others.sort(key=lambda item: item[0], reverse=True)
+    return (rank_indexes(winners, term_ids, n_terms, long_document)
+            + [i for score, i in others] + unscored)
+
+def exact_indexes(indexes, term_ids, n_terms):
+
+    # The sentences at the given indexes, best first, in one graph
+    scores = graph_scores([term_ids[i] for i in indexes], n_terms)
+    scored = [p for p in range(len(indexes)) if scores[p] is not None]
+    scored.sort(key=lambda p: scores[p], reverse=True)
+    unscored = [p for p in range(len(indexes)) if scores[p] is None]
+    return [indexes[p] for p in scored + unscored]
+
+#####################################################################
+
+def keyword_scores(analysis):
+
+    '''
+    Score every term of an Analysis with TextRank.
+    Terms that occur next to each other (across the whole
+    text, in order) are linked, and PageRank ranks the terms.
+    Returns a numpy array with one score per term id.
+    '''
+
+    sequence = np.array([term for ids in analysis.term_ids for term in ids], dtype=np.intp)
+    n = len(analysis.terms)
+    if n < 2:
+        return np.ones(n)
+
+    # One unweighted edge between neighbouring terms
+    left = sequence[:-1]
+    right = sequence[1:]
+    different = left != right
+    edges = sparse.csr_matrix((np.ones(different.sum()), (left[different], right[different])),
+                              shape=(n, n))
+    graph = edges + edges.T
+    graph.data[:] = 1
+
+    return pagerank(graph)
+
+#####################################################################
+
+def keywords(text, ratio=0.2, words=None, split=False):
+
+    '''
+    Drop-in replacement for gensim.summarization.keywords.
+
+    Returns the most important words of the text, best first:
+    ratio of the distinct terms, or the given number of words.
+    Returns a list when split is True and a newline-separated
+    string otherwise.
+    '''
+
+    return keywords_analysis(analyze(text), ratio, words, split)
+
+#####################################################################
+
+@timed('keywords')
+def keywords_analysis(analysis, ratio=0.2, words=None, split=False):
+
+    # keywords, for a text that has already been analyzed
+    scores = keyword_scores(analysis)
+    if words is None:
+        words = int(len(analysis.terms) * ratio)
+
+    ranked = np.argsort(-scores, kind='stable')[:words]
+    result = [analysis.surface[term] for term in ranked]
+    return result if split else '\n'.join(result)
+
+#####################################################################
+
+if __name__ == '__main__':
+
+    # Benchmark against gensim on every part of the bundled volume
+    import time
+    from functions import iter_sections, preprocess
+
+    texts = []
+    for number, text in iter_sections('CFR_Title13_Volume1.xml'):
+        texts.append(preprocess(text))
+    texts = [text for text, sentences in zip(texts, split_batch(texts)) if len(sentences) > 1]
+
+    start = time.perf_counter()
+    ours = [summarize(text, ratio=0.1, split=True) for text in texts]
+    ours_time = time.perf_counter() - start
+    print("textrank: %d sections in %.2f s" % (len(texts), ours_time))
+
+    try:
+        from gensim.summarization import summarize as gensim_summarize
+    except ImportError:
+        print("gensim.summarization is not installed, nothing to compare against")
+    else:
+        start = time.perf_counter()
+        theirs = [gensim_summarize(text, ratio=0.1, split=True) for text in texts]
+        theirs_time = time.perf_counter() - start
+        print("gensim:   %d sections in %.2f s (%.1fx slower)"
+              % (len(texts), theirs_time, theirs_time / ours_time))
+
+        # How many of gensim's sentences we picked as well
+        shared = 0
+        total = 0
+        for a, b in zip(ours, theirs):
+            shared += len(set(a) & set(b))
+            total += len(b)
+        print("sentence overlap with gensim: %.1f%%" % (100 * shared / max(total, 1)))